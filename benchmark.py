@@ -0,0 +1,712 @@
+#!/usr/bin/env python3
+
+"""Performance benchmarks for the graph and starmap code.
+
+Running it directly (python3 benchmark.py) runs the standard suite
+over synthetic starmaps and prints a table.  --output saves the results
+as JSON, and --baseline compares them with an earlier saved run,
+exiting with status 1 if anything got slower or bigger than the
+tolerance allows:
+
+    python3 benchmark.py --output before.json
+    (change something)
+    python3 benchmark.py --baseline before.json
+
+--sizes picks the starmap sizes (up to a million stars or so, given
+the time and memory) and --only picks benchmarks by name.
+--comparisons runs the older side by side comparisons of engines and
+representations instead.  Everything uses a seeded random generator,
+so repeated runs build the same graphs."""
+
+from graph import Graph, GraphNode, CompactGraphNode, CSRGraph, TraversalState
+from graph import ConnectivityIndex
+from routeservice import RouteService
+from routetable import RouteTable
+import starmap
+import argparse
+import asyncio
+import gc
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+
+def random_graph(size, degree=4, seed=0):
+    """Builds a random directed graph with SIZE nodes and about DEGREE
+    weighted out edges per node"""
+    rng = random.Random(seed)
+    g = Graph()
+    for i in range(size):
+        g[i] = "Node{}".format(i)
+    for i in range(size):
+        for _ in range(degree):
+            dest = rng.randrange(size)
+            if dest != i and not g.connected(i, dest):
+                g.connect(i, dest, rng.uniform(1, 100))
+    return g
+
+
+def bench_dijkstra(sizes=(250, 1000, 4000)):
+    """Times a full dijkstra traversal with the heap and scan engines"""
+    results = []
+    for size in sizes:
+        g = random_graph(size)
+        row = {"size": size}
+        for engine in ("heap", "scan"):
+            reference = time.time()
+            for _ in g.dijkstra_traversal(0, engine=engine):
+                pass
+            row[engine] = time.time() - reference
+        results.append(row)
+        print("dijkstra {:>7} nodes: heap {:.4f}s scan {:.4f}s".format(
+            size, row["heap"], row["scan"]))
+    return results
+
+
+def random_starmap(size, radius=None, seed=0):
+    """Builds a starmap dictionary of SIZE stars scattered uniformly in a
+    cube.  The cube grows with SIZE so the density stays about the same
+    as starmap.txt."""
+    rng = random.Random(seed)
+    if radius is None:
+        radius = 100 * (size / 100) ** (1 / 3)
+    stars = {}
+    for i in range(size):
+        stars["Star{}".format(i)] = (rng.uniform(-radius, radius),
+                                     rng.uniform(-radius, radius),
+                                     rng.uniform(-radius, radius))
+    return stars
+
+
+def bench_jump_edges(sizes=(1000, 10000, 100000), jumpdrive=30):
+    """Times generating the jump edges with the spatial grid"""
+    results = []
+    for size in sizes:
+        stars = random_starmap(size)
+        reference = time.time()
+        edges = sum(1 for _ in starmap.jump_edges(stars, jumpdrive))
+        row = {"size": size, "edges": edges,
+               "grid": time.time() - reference}
+        results.append(row)
+        print("jump edges {:>7} stars: {} edges in {:.4f}s".format(
+            size, edges, row["grid"]))
+    return results
+
+
+def bench_csr(sizes=(10000, 50000), jumpdrive=60):
+    """Compares memory and traversal time of a jump graph as a Graph
+    and as a CSRGraph"""
+    results = []
+    for size in sizes:
+        stars = random_starmap(size)
+        tracemalloc.start()
+        g = starmap.build_jump_graph(stars, jumpdrive)
+        graph_bytes = tracemalloc.get_traced_memory()[0]
+        csr = CSRGraph.from_graph(g)
+        csr_bytes = tracemalloc.get_traced_memory()[0] - graph_bytes
+        tracemalloc.stop()
+        row = {"size": size, "edges": csr.edge_count(),
+               "graph_bytes": graph_bytes, "csr_bytes": csr_bytes}
+        for traversal in ("dijkstra_traversal", "bfs_traversal"):
+            for label, target in (("graph", g), ("csr", csr)):
+                reference = time.time()
+                for _ in getattr(target, traversal)("Star0"):
+                    pass
+                row[label + "_" + traversal] = time.time() - reference
+        results.append(row)
+        print("csr {:>7} stars, {} edges: {:.1f}x smaller, dijkstra "
+              "{:.4f}s vs {:.4f}s, bfs {:.4f}s vs {:.4f}s".format(
+                  size, row["edges"], graph_bytes / csr_bytes,
+                  row["graph_dijkstra_traversal"], row["csr_dijkstra_traversal"],
+                  row["graph_bfs_traversal"], row["csr_bfs_traversal"]))
+    return results
+
+
+def bench_bidirectional(sizes=(10000, 50000), jumpdrive=60, queries=20, seed=0):
+    """Compares a dijkstra traversal stopped at the destination with the
+    bidirectional search on random point to point jump graph queries,
+    counting settled nodes and time"""
+    results = []
+    rng = random.Random(seed)
+    for size in sizes:
+        stars = random_starmap(size, seed=seed)
+        g = starmap.build_jump_graph(stars, jumpdrive)
+        names = list(stars)
+        row = {"size": size, "dijkstra_settled": 0, "bidirectional_settled": 0,
+               "dijkstra": 0.0, "bidirectional": 0.0}
+        for _ in range(queries):
+            source, dest = rng.choice(names), rng.choice(names)
+            reference = time.time()
+            state = TraversalState()
+            for node in g.dijkstra_traversal(source, state=state):
+                row["dijkstra_settled"] += 1
+                if node.name == dest:
+                    break
+            row["dijkstra"] += time.time() - reference
+            reference = time.time()
+            forward, backward = TraversalState(), TraversalState()
+            g.bidirectional_search(source, dest, forward, backward)
+            row["bidirectional"] += time.time() - reference
+            for state in (forward, backward):
+                row["bidirectional_settled"] += sum(
+                    1 for color in state.color.values() if color == "black")
+        results.append(row)
+        print("bidirectional {:>7} stars: settled {} vs {}, {:.4f}s vs "
+              "{:.4f}s for {} queries".format(
+                  size, row["dijkstra_settled"], row["bidirectional_settled"],
+                  row["dijkstra"], row["bidirectional"], queries))
+    return results
+
+
+def bench_bulk_edges(nodes=100000, edges=1000000, seed=0):
+    """Times building the same graph with one connect per edge and
+    with add_edges, validated and not"""
+    rng = random.Random(seed)
+    triples = {}
+    while len(triples) < edges:
+        source, dest = rng.randrange(nodes), rng.randrange(nodes)
+        if source != dest:
+            triples[source, dest] = rng.uniform(1, 100)
+    triples = [(source, dest, w) for (source, dest), w in triples.items()]
+    row = {"nodes": nodes, "edges": edges}
+
+    def connect():
+        g = Graph()
+        for i in range(nodes):
+            g[i] = None
+        for source, dest, w in triples:
+            g.connect(source, dest, w)
+
+    def bulk(validate):
+        g = Graph()
+        g.add_nodes((i, None) for i in range(nodes))
+        g.add_edges(triples, validate=validate)
+
+    for label, build in (("connect", connect),
+                         ("add_edges", lambda: bulk(True)),
+                         ("add_edges_trusted", lambda: bulk(False))):
+        # Collection passes over the millions of new dictionaries would
+        # otherwise swamp the difference being measured
+        gc.collect()
+        gc.disable()
+        try:
+            reference = time.time()
+            build()
+            row[label] = time.time() - reference
+        finally:
+            gc.enable()
+    print("bulk {} edges: connect {:.3f}s, add_edges {:.3f}s, trusted "
+          "{:.3f}s".format(edges, row["connect"], row["add_edges"],
+                           row["add_edges_trusted"]))
+    return [row]
+
+
+# Metrics where a bigger number in a later run is a regression.  Rates
+# are left out since they just restate the time.
+LOWER_IS_BETTER = ("seconds", "bytes_per_node", "bytes_per_edge",
+                   "p50_seconds", "p99_seconds", "peak_bytes")
+
+SUITE_VERSION = 1
+
+
+def _best(function, repeat):
+    """The lowest wall clock time of REPEAT calls to FUNCTION"""
+    best = float('inf')
+    for _ in range(repeat):
+        gc.collect()
+        reference = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - reference)
+    return best
+
+
+class _Fixture():
+    """The starmap, jump graph and query pairs one size is measured on"""
+    def __init__(self, size, jumpdrive, seed, queries):
+        self.size = size
+        self.jumpdrive = jumpdrive
+        self.stars = random_starmap(size, seed=seed)
+        self.names = list(self.stars)
+        self.graph = starmap.build_jump_graph(self.stars, jumpdrive)
+        self.edges = sum(len(node.edges) for node in self.graph)
+        rng = random.Random(seed)
+        self.pairs = [(rng.choice(self.names), rng.choice(self.names))
+                      for _ in range(queries)]
+
+
+def suite_jump_edges(fixture, repeat):
+    seconds = _best(lambda: sum(1 for _ in starmap.jump_edges(
+        fixture.stars, fixture.jumpdrive)), repeat)
+    return {"seconds": seconds, "edges": fixture.edges,
+            "edges_per_second": fixture.edges / seconds}
+
+
+def suite_build_graph(fixture, repeat):
+    seconds = _best(lambda: starmap.build_jump_graph(
+        fixture.stars, fixture.jumpdrive), repeat)
+    return {"seconds": seconds, "edges": fixture.edges,
+            "edges_per_second": fixture.edges / seconds}
+
+
+def _suite_traversal(name):
+    def run(fixture, repeat):
+        visited = []
+
+        def traverse():
+            traversal = getattr(fixture.graph, name)
+            visited[:] = [sum(1 for _ in traversal(fixture.names[0],
+                                                    state=TraversalState()))]
+        seconds = _best(traverse, repeat)
+        return {"seconds": seconds, "nodes": visited[0],
+                "nodes_per_second": visited[0] / seconds}
+    run.__name__ = "suite_" + name
+    return run
+
+
+def _suite_queries(search):
+    def run(fixture, repeat):
+        def queries():
+            for source, dest in fixture.pairs:
+                search(fixture, source, dest)
+        seconds = _best(queries, repeat)
+        return {"seconds": seconds, "queries": len(fixture.pairs),
+                "seconds_per_query": seconds / len(fixture.pairs)}
+    return run
+
+
+def _astar(fixture, source, dest):
+    goal = fixture.stars[dest]
+    fixture.graph.astar_search(
+        source, dest, lambda node: starmap.calcDistance(node.data, goal),
+        state=TraversalState())
+
+
+suite_astar = _suite_queries(_astar)
+
+
+def _bidirectional(fixture, source, dest):
+    fixture.graph.bidirectional_search(source, dest)
+
+
+def suite_connectivity(fixture, repeat):
+    """Building the union-find index of the jump graph, then answering
+    the route queries from it"""
+    def build():
+        index = ConnectivityIndex(fixture.graph)
+        index.may_reach(*fixture.pairs[0])
+        index.close()
+    seconds = _best(build, repeat)
+    index = fixture.graph.connectivity()
+    index.may_reach(*fixture.pairs[0])
+    query_seconds = _best(lambda: [index.may_reach(source, dest)
+                                   for source, dest in fixture.pairs], repeat)
+    return {"seconds": seconds,
+            "seconds_per_query": query_seconds / len(fixture.pairs)}
+
+
+def suite_strong_components(fixture, repeat):
+    components = []
+
+    def run():
+        components[:] = fixture.graph.strongly_connected_components()
+    seconds = _best(run, repeat)
+    return {"seconds": seconds, "components": len(components),
+            "nodes_per_second": fixture.size / seconds}
+
+
+def suite_traverse_starmap(fixture, repeat):
+    """A whole route query, building the jump edges as it goes"""
+    source, dest = fixture.pairs[0]
+    seconds = _best(lambda: starmap.traverse_starmap(
+        fixture.stars, source, dest, fixture.jumpdrive), repeat)
+    return {"seconds": seconds}
+
+
+def suite_implicit(fixture, repeat):
+    """Route queries on an ImplicitJumpGraph, which finds the jumps as
+    the search goes, and the most memory one of them took"""
+    graph = starmap.ImplicitJumpGraph(fixture.stars, fixture.jumpdrive,
+                                      cache_size=0)
+
+    def queries():
+        for source, dest in fixture.pairs:
+            graph.route(source, dest)
+    seconds = _best(queries, repeat)
+    expanded = graph.expanded
+    peak = 0
+    for source, dest in fixture.pairs:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            graph.route(source, dest)
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+    return {"seconds": seconds, "queries": len(fixture.pairs),
+            "seconds_per_query": seconds / len(fixture.pairs),
+            "nodes_per_query": expanded / (repeat * len(fixture.pairs)),
+            "peak_bytes": peak}
+
+
+def suite_delete_hub(fixture, repeat):
+    """Deletes a node with an edge to and from every other node"""
+    best = float('inf')
+    for _ in range(repeat):
+        g = Graph()
+        g.add_nodes((name, None) for name in fixture.names)
+        g["hub"] = None
+        g.add_edges((("hub", name, 1) for name in fixture.names),
+                    validate=False)
+        g.add_edges(((name, "hub", 1) for name in fixture.names),
+                    validate=False)
+        gc.collect()
+        reference = time.perf_counter()
+        del g["hub"]
+        best = min(best, time.perf_counter() - reference)
+    edges = 2 * len(fixture.names)
+    return {"seconds": best, "edges": edges, "edges_per_second": edges / best}
+
+
+def suite_snapshot(fixture, repeat):
+    """Reweights the first edge of every star while a snapshot taken
+    beforehand is held, so every node is copied on write once"""
+    best = float('inf')
+    kept = 0
+    for _ in range(repeat):
+        g = starmap.build_jump_graph(fixture.stars, fixture.jumpdrive)
+        edges = [(node.name, next(iter(node.edges)).name) for node in g
+                 if node.edges]
+        gc.collect()
+        reference = time.perf_counter()
+        snapshot = g.snapshot()
+        for source, dest in edges:
+            g.disconnect(source, dest)
+            g.connect(source, dest, 1)
+        best = min(best, time.perf_counter() - reference)
+        kept = len(snapshot.saved)
+    return {"seconds": best, "updates": len(edges),
+            "seconds_per_update": best / max(len(edges), 1),
+            "kept_nodes": kept}
+
+
+def _suite_region(remove):
+    def run(fixture, repeat):
+        """Deletes the fifth of the stars with the lowest x"""
+        region = sorted(fixture.names,
+                        key=lambda name: fixture.stars[name][0])
+        region = region[:len(region) // 5]
+        best = float('inf')
+        for _ in range(repeat):
+            g = starmap.build_jump_graph(fixture.stars, fixture.jumpdrive)
+            edges = sum(len(g[name].edges) + len(g[name].back_edges)
+                        for name in region)
+            gc.collect()
+            reference = time.perf_counter()
+            remove(g, region)
+            best = min(best, time.perf_counter() - reference)
+        return {"seconds": best, "nodes": len(region), "edges": edges,
+                "edges_per_second": edges / best}
+    return run
+
+
+def _delete_each(g, names):
+    for name in names:
+        del g[name]
+
+
+def _lazy_delete(g, names):
+    g.lazy_delete = True
+    g.remove_nodes(names)
+    g.compact()
+
+
+def _percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def service_load(stars, pairs, jumpdrive, clients):
+    """Plays PAIRS against a RouteService from CLIENTS concurrent
+    clients, each sending its next query as soon as the last one is
+    answered.  Returns the sorted latencies and the total time."""
+    async def run():
+        latencies = []
+        queue = iter(pairs)
+        async with RouteService(stars) as service:
+            # Build the graph first so it isn't in the latencies
+            await service.route(pairs[0][0], pairs[0][0], jumpdrive)
+
+            async def client():
+                for source, dest in queue:
+                    reference = time.perf_counter()
+                    await service.route(source, dest, jumpdrive)
+                    latencies.append(time.perf_counter() - reference)
+            reference = time.perf_counter()
+            await asyncio.gather(*(client() for _ in range(clients)))
+            return sorted(latencies), time.perf_counter() - reference
+    return asyncio.run(run())
+
+
+def service_pairs(names, count, seed=0, popular=20):
+    """Route queries where most come from a few popular stars, as
+    they would from a busy server"""
+    rng = random.Random(seed)
+    hot = [rng.choice(names) for _ in range(popular)]
+    return [(rng.choice(hot) if rng.random() < 0.8 else rng.choice(names),
+             rng.choice(names)) for _ in range(count)]
+
+
+def suite_route_service(fixture, repeat, clients=32):
+    """Latency of route queries through the asyncio service under a
+    load of CLIENTS concurrent clients"""
+    pairs = service_pairs(fixture.names, 10 * len(fixture.pairs))
+    best = None
+    for _ in range(repeat):
+        latencies, seconds = service_load(fixture.stars, pairs,
+                                          fixture.jumpdrive, clients)
+        if best is None or seconds < best[1]:
+            best = latencies, seconds
+    latencies, seconds = best
+    return {"seconds": seconds, "queries": len(pairs),
+            "queries_per_second": len(pairs) / seconds,
+            "p50_seconds": _percentile(latencies, 0.5),
+            "p99_seconds": _percentile(latencies, 0.99)}
+
+
+def _suite_memory(node_class):
+    def run(fixture, repeat):
+        """Bytes the jump graph uses per node and per edge"""
+        edges = list(starmap.jump_edges(fixture.stars, fixture.jumpdrive))
+        gc.collect()
+        tracemalloc.start()
+        try:
+            g = Graph(node_class=node_class)
+            g.add_nodes(fixture.stars.items())
+            node_bytes = tracemalloc.get_traced_memory()[0]
+            g.add_edges(edges, validate=False)
+            edge_bytes = tracemalloc.get_traced_memory()[0] - node_bytes
+        finally:
+            tracemalloc.stop()
+        return {"bytes_per_node": node_bytes / len(g),
+                "bytes_per_edge": edge_bytes / max(len(edges), 1)}
+    return run
+
+
+SUITE = {
+    "jump_edges": suite_jump_edges,
+    "build_graph": suite_build_graph,
+    "bfs": _suite_traversal("bfs_traversal"),
+    "dfs": _suite_traversal("dfs_traversal"),
+    "dfs_iterative": _suite_traversal("dfs_iterative_traversal"),
+    "dijkstra": _suite_traversal("dijkstra_traversal"),
+    "astar": suite_astar,
+    "bidirectional": _suite_queries(_bidirectional),
+    "strong_components": suite_strong_components,
+    "connectivity": suite_connectivity,
+    "traverse_starmap": suite_traverse_starmap,
+    "implicit": suite_implicit,
+    "delete_hub": suite_delete_hub,
+    "delete_region": _suite_region(_delete_each),
+    "remove_region": _suite_region(Graph.remove_nodes),
+    "remove_region_lazy": _suite_region(_lazy_delete),
+    "route_service": suite_route_service,
+    "snapshot": suite_snapshot,
+    "memory": _suite_memory(GraphNode),
+    "memory_compact": _suite_memory(CompactGraphNode),
+}
+
+
+def run_suite(sizes=(1000, 10000, 100000), jumpdrive=60, seed=0, repeat=3,
+              queries=20, only=None, log=print):
+    """Runs the benchmarks named in ONLY (all of SUITE by default) on
+    a seeded starmap of each size, returning a report that can be saved
+    as JSON.  A benchmark that raises is recorded with its error rather
+    than stopping the run."""
+    names = list(SUITE) if only is None else list(only)
+    for name in names:
+        if name not in SUITE:
+            raise ValueError("Unknown benchmark {}".format(name))
+    results = []
+    for size in sizes:
+        fixture = _Fixture(size, jumpdrive, seed, queries)
+        for name in names:
+            row = {"benchmark": name, "size": size}
+            try:
+                row.update(SUITE[name](fixture, repeat))
+            except Exception as e:
+                row["error"] = "{}: {}".format(type(e).__name__, e)
+            results.append(row)
+            if log is not None:
+                log(_format_row(row))
+    return {"version": SUITE_VERSION, "python": sys.version.split()[0],
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(), "jumpdrive": jumpdrive,
+            "seed": seed, "repeat": repeat, "queries": queries,
+            "results": results}
+
+
+def _format_row(row):
+    metrics = ", ".join("{} {:.6g}".format(key, value)
+                        for key, value in row.items()
+                        if key not in ("benchmark", "size", "error"))
+    return "{:<17} {:>8}: {}".format(row["benchmark"], row["size"],
+                                     row.get("error", metrics))
+
+
+def compare_results(report, baseline, tolerance=0.1):
+    """Compares two suite reports.  Returns (benchmark, size, metric,
+    baseline value, new value, ratio, regressed) tuples for every
+    metric they both measured, where a ratio above 1 + TOLERANCE is a
+    regression.  A benchmark that failed this time where the baseline
+    has metrics is a regression in each of them, with an infinite new
+    value."""
+    before = {(row["benchmark"], row["size"]): row
+              for row in baseline["results"]}
+    rows = []
+    for row in report["results"]:
+        old = before.get((row["benchmark"], row["size"]))
+        if old is None:
+            continue
+        if "error" in row:
+            for metric in LOWER_IS_BETTER:
+                if metric in old:
+                    rows.append((row["benchmark"], row["size"], metric,
+                                 old[metric], float('inf'), float('inf'),
+                                 True))
+            continue
+        for metric in LOWER_IS_BETTER:
+            if metric in row and metric in old and old[metric] > 0:
+                ratio = row[metric] / old[metric]
+                rows.append((row["benchmark"], row["size"], metric,
+                             old[metric], row[metric], ratio,
+                             ratio > 1 + tolerance))
+    return rows
+
+
+def bench_compact_nodes(nodes=1000000):
+    """Compares the memory per node of a GraphNode graph and a
+    CompactGraphNode one, with no edges"""
+    row = {"nodes": nodes}
+    for node_class in (GraphNode, CompactGraphNode):
+        gc.collect()
+        tracemalloc.start()
+        g = Graph(node_class=node_class)
+        g.add_nodes((i, None) for i in range(nodes))
+        row[node_class.__name__] = tracemalloc.get_traced_memory()[0] / nodes
+        tracemalloc.stop()
+        del g
+    print("{} nodes: GraphNode {:.1f} bytes per node, CompactGraphNode "
+          "{:.1f}".format(nodes, row["GraphNode"], row["CompactGraphNode"]))
+    return [row]
+
+
+def bench_route_service(size=10000, queries=2000, clients=(1, 8, 64),
+                        jumpdrive=60):
+    """Load tests the asyncio route service with different numbers of
+    concurrent clients, reporting latency percentiles"""
+    stars = random_starmap(size)
+    pairs = service_pairs(list(stars), queries)
+    results = []
+    for count in clients:
+        latencies, seconds = service_load(stars, pairs, jumpdrive, count)
+        row = {"clients": count, "seconds": seconds,
+               "p50": _percentile(latencies, 0.5),
+               "p99": _percentile(latencies, 0.99)}
+        results.append(row)
+        print("route service {} stars, {:>3} clients: {:.0f} queries/s, "
+              "p50 {:.2f}ms, p99 {:.2f}ms".format(
+                  size, count, queries / seconds, 1000 * row["p50"],
+                  1000 * row["p99"]))
+    return results
+
+
+def bench_route_table(sizes=(1000, 5000, 10000), jumpdrive=60, queries=1000,
+                      seed=0):
+    """Times building an all pairs RouteTable and answering queries
+    from it, next to A* searches over the jump graph.  The table takes
+    about 5 or 6 bytes per pair of stars."""
+    results = []
+    rng = random.Random(seed)
+    for size in sizes:
+        stars = random_starmap(size, seed=seed)
+        names = list(stars)
+        pairs = [(rng.choice(names), rng.choice(names))
+                 for _ in range(queries)]
+        reference = time.perf_counter()
+        table = RouteTable.build(stars, jumpdrive)
+        row = {"size": size, "build": time.perf_counter() - reference,
+               "bytes": table.nbytes()}
+        reference = time.perf_counter()
+        for source, dest in pairs:
+            table.route(source, dest)
+        row["query"] = (time.perf_counter() - reference) / queries
+        del table
+        fixture = _Fixture(size, jumpdrive, seed, 20)
+        row["astar_query"] = suite_astar(fixture, 1)["seconds_per_query"]
+        results.append(row)
+        print("route table {:>6} stars: built in {:.1f}s, {:.1f}MB, "
+              "{:.1f}us per query vs {:.1f}us for A*".format(
+                  size, row["build"], row["bytes"] / 2 ** 20,
+                  1e6 * row["query"], 1e6 * row["astar_query"]))
+    return results
+
+
+def run_comparisons():
+    bench_dijkstra()
+    bench_jump_edges()
+    bench_csr()
+    bench_bidirectional()
+    bench_bulk_edges()
+    bench_compact_nodes()
+    bench_route_service()
+    bench_route_table()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Graph and starmap benchmarks")
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[1000, 10000, 100000],
+                        help="starmap sizes to run the suite on")
+    parser.add_argument("--only", nargs="+", choices=list(SUITE),
+                        help="benchmarks to run (default all)")
+    parser.add_argument("--jumpdrive", type=float, default=60)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="runs per benchmark, the best is kept")
+    parser.add_argument("--queries", type=int, default=20,
+                        help="route queries per size")
+    parser.add_argument("--output", help="file to save the JSON results in")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="allowed slowdown before it counts as a "
+                        "regression (0.1 is 10%%)")
+    parser.add_argument("--comparisons", action="store_true",
+                        help="run the engine comparisons instead")
+    args = parser.parse_args(argv)
+    if args.comparisons:
+        run_comparisons()
+        return 0
+    report = run_suite(args.sizes, args.jumpdrive, args.seed, args.repeat,
+                       args.queries, args.only)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=1)
+    if not args.baseline:
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = 0
+    for name, size, metric, old, new, ratio, regressed in compare_results(
+            report, baseline, args.tolerance):
+        regressions += regressed
+        print("{:<17} {:>8} {:<15} {:>12.6g} -> {:<12.6g} {:6.2f}x{}".format(
+            name, size, metric, old, new, ratio,
+            "  REGRESSION" if regressed else ""))
+    print("{} regressions".format(regressions))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
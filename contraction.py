@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+
+"""Contraction hierarchies for fast point to point shortest paths.
+
+Building one takes a while, but afterwards each query is a pair of
+small dijkstra searches instead of a search over the whole graph.
+
+The nodes are contracted one at a time, least important first.
+Contracting a node takes it out of the graph, and for every in
+neighbor u and out neighbor w whose only shortest path was u->node->w
+it adds a "shortcut" edge u->w with the combined weight, so distances
+between the remaining nodes don't change.  A node's rank is its place
+in that order.  Any shortest path then goes up in rank and then down
+again, so a query searches upward from the source, and upward over
+reversed edges from the destination, and takes the best node where
+the two searches meet.
+"""
+
+from heapq import heappush, heappop
+from itertools import count
+import pickle
+
+
+class ContractionHierarchy():
+    """A contraction hierarchy for a Graph.
+
+    The hierarchy copies what it needs out of the graph by node name,
+    so later changes to the graph are not reflected in it.
+
+    WITNESS_LIMIT caps how many nodes the search for a path around a
+    contracted node may settle.  When it gives up a shortcut is added
+    anyway, which is always safe but can add a few unneeded edges.
+
+    Preprocessing suits sparse graphs like jump graphs with a jumpdrive
+    that is short next to the map.  Ordering the nodes costs about the
+    square of each node's degree, so nearly complete graphs are slow
+    to contract (and gain little from it).
+    """
+    FORMAT_VERSION = 1
+
+    def __init__(self, graph=None, witness_limit=500):
+        # rank[name] is the node's place in the contraction order
+        self.rank = {}
+        # up[name] lists (higher node, weight) for edges out of name,
+        # down[name] lists (higher node, weight) for edges into name
+        self.up = {}
+        self.down = {}
+        # The node a shortcut (source, dest) skips over
+        self.middle = {}
+        if graph is not None:
+            self._build(graph, witness_limit)
+
+    def _build(self, graph, witness_limit):
+        graph.compact()
+        out = {}
+        into = {}
+        for node in graph:
+            out[node.name] = {dest.name: weight
+                              for dest, weight in node.all_edges()}
+            into[node.name] = {source.name: weight
+                               for source, weight in node.back_edges.items()}
+        contracted_neighbors = dict.fromkeys(out, 0)
+
+        def priority(name):
+            # The edge difference, estimated by counting the shortcuts
+            # a direct edge doesn't already rule out, so that no
+            # witness searches are needed to order the nodes
+            shortcuts = 0
+            for source, w1 in into[name].items():
+                direct = out[source]
+                for dest, w2 in out[name].items():
+                    if (dest != source and
+                            direct.get(dest, float('inf')) > w1 + w2):
+                        shortcuts += 1
+            return (shortcuts - len(out[name]) - len(into[name])
+                    + contracted_neighbors[name])
+
+        counter = count()
+        heap = [(priority(name), next(counter), name) for name in out]
+        heap.sort()
+        while heap:
+            _, _, name = heappop(heap)
+            # Priorities go stale as neighbors are contracted, so check
+            # this one again before trusting it
+            current = priority(name)
+            if heap and current > heap[0][0]:
+                heappush(heap, (current, next(counter), name))
+                continue
+            for source, dest, weight in self._shortcuts(name, out, into,
+                                                        witness_limit):
+                if weight < out[source].get(dest, float('inf')):
+                    out[source][dest] = weight
+                    into[dest][source] = weight
+                    self.middle[source, dest] = name
+            self.rank[name] = len(self.rank)
+            self.up[name] = list(out[name].items())
+            self.down[name] = list(into[name].items())
+            for dest in out[name]:
+                del into[dest][name]
+                contracted_neighbors[dest] += 1
+            for source in into[name]:
+                del out[source][name]
+                contracted_neighbors[source] += 1
+            del out[name]
+            del into[name]
+
+    def _shortcuts(self, name, out, into, witness_limit):
+        """The (source, dest, weight) shortcuts contracting NAME needs"""
+        shortcuts = []
+        for source, w1 in into[name].items():
+            # A direct edge that is already short enough is a witness
+            # without searching
+            direct = out[source]
+            targets = {dest: w1 + w2 for dest, w2 in out[name].items()
+                       if dest != source and
+                       direct.get(dest, float('inf')) > w1 + w2}
+            if not targets:
+                continue
+            witness = self._witness(source, name, targets, out,
+                                    max(targets.values()), witness_limit)
+            for dest, weight in targets.items():
+                if witness.get(dest, float('inf')) > weight:
+                    shortcuts.append((source, dest, weight))
+        return shortcuts
+
+    def _witness(self, source, avoid, targets, out, limit, witness_limit):
+        """A dijkstra from SOURCE that skips AVOID, giving up past a
+        distance of LIMIT or after settling WITNESS_LIMIT nodes"""
+        distance = {source: 0}
+        settled = set()
+        remaining = len(targets)
+        counter = count()
+        heap = [(0, next(counter), source)]
+        while heap and len(settled) < witness_limit:
+            node_distance, _, node = heappop(heap)
+            if node in settled:
+                continue
+            if node_distance > limit:
+                break
+            settled.add(node)
+            if node in targets:
+                remaining -= 1
+                if remaining == 0:
+                    break
+            for dest, weight in out[node].items():
+                if dest == avoid:
+                    continue
+                new_distance = node_distance + weight
+                if new_distance < distance.get(dest, float('inf')):
+                    distance[dest] = new_distance
+                    heappush(heap, (new_distance, next(counter), dest))
+        return distance
+
+    def __len__(self):
+        return len(self.rank)
+
+    def shortcut_count(self):
+        return len(self.middle)
+
+    def _upward(self, start, edges):
+        distance = {start: 0}
+        previous = {start: None}
+        counter = count()
+        heap = [(0, next(counter), start)]
+        settled = set()
+        while heap:
+            node_distance, _, node = heappop(heap)
+            if node in settled:
+                continue
+            settled.add(node)
+            for dest, weight in edges[node]:
+                new_distance = node_distance + weight
+                if new_distance < distance.get(dest, float('inf')):
+                    distance[dest] = new_distance
+                    previous[dest] = node
+                    heappush(heap, (new_distance, next(counter), dest))
+        return distance, previous
+
+    def distance(self, source_name, dest_name):
+        """The shortest distance between two nodes, inf if there is no
+        path"""
+        return self._query(source_name, dest_name)[0]
+
+    def path(self, source_name, dest_name):
+        """The list of node names on a shortest path between two nodes,
+        with any shortcuts expanded, or [] if there is no path"""
+        best, meeting, forward, backward = self._query(source_name, dest_name)
+        if meeting is None:
+            return []
+        path = [meeting]
+        while forward[path[-1]] is not None:
+            path.append(forward[path[-1]])
+        path.reverse()
+        while backward[path[-1]] is not None:
+            path.append(backward[path[-1]])
+        expanded = [path[0]]
+        for source, dest in zip(path, path[1:]):
+            self._unpack(source, dest, expanded)
+        return expanded
+
+    def _query(self, source_name, dest_name):
+        for name in (source_name, dest_name):
+            if name not in self.rank:
+                raise IndexError("Unable to find {}".format(name))
+        forward_distance, forward = self._upward(source_name, self.up)
+        backward_distance, backward = self._upward(dest_name, self.down)
+        best = float('inf')
+        meeting = None
+        for node, distance in forward_distance.items():
+            if node in backward_distance:
+                total = distance + backward_distance[node]
+                if total < best:
+                    best = total
+                    meeting = node
+        return best, meeting, forward, backward
+
+    def _unpack(self, source, dest, path):
+        """Appends the nodes after SOURCE on the edge source->dest to
+        PATH, replacing shortcuts by the edges they stand for"""
+        stack = [(source, dest)]
+        while stack:
+            source, dest = stack.pop()
+            middle = self.middle.get((source, dest))
+            if middle is None:
+                path.append(dest)
+            else:
+                stack.append((middle, dest))
+                stack.append((source, middle))
+
+    def save(self, f):
+        """Writes the hierarchy to the file F"""
+        with open(f, "wb") as file:
+            pickle.dump(("contraction-hierarchy", self.FORMAT_VERSION,
+                         self.rank, self.up, self.down, self.middle), file)
+
+    @classmethod
+    def load(cls, f):
+        """Reads a hierarchy written by save().  Only load files you
+        trust, since this unpickles them."""
+        with open(f, "rb") as file:
+            saved = pickle.load(file)
+        if (not isinstance(saved, tuple) or len(saved) != 6
+                or saved[0] != "contraction-hierarchy"):
+            raise ValueError("{} is not a saved contraction hierarchy".format(f))
+        if saved[1] != cls.FORMAT_VERSION:
+            raise ValueError("{} is version {}, expected version {}".format(
+                f, saved[1], cls.FORMAT_VERSION))
+        hierarchy = cls()
+        _, _, hierarchy.rank, hierarchy.up, hierarchy.down, \
+            hierarchy.middle = saved
+        return hierarchy
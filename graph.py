@@ -1,10 +1,30 @@
 #!/usr/bin/env python3
 
+from array import array
 from collections import deque
+from collections.abc import Mapping
+from heapq import heappush, heappop
+from functools import partial
+from itertools import chain, count
+import threading
+import weakref
 
 # problem : all_edges isn't returning the graphnode object
 
-class GraphNode():
+class CompactGraphNode():
+    """A node with just its name, data and edges.
+
+    It uses __slots__ and keeps nothing for traversals, which keep
+    their working values in a TraversalState instead, so it is a lot
+    smaller than a GraphNode.  Pass node_class=CompactGraphNode to
+    Graph to use it.
+    """
+    __slots__ = ("name", "data", "edges", "back_edges")
+
+    # Whether traversals without a TraversalState leave their results
+    # on the node
+    stores_traversal = False
+
     def __init__(self, name, data=None):
         """Initialization for the node itself.
 
@@ -32,12 +52,6 @@ class GraphNode():
         # so we can go backwards even though it is a directed graph.
         self.back_edges = {}
 
-        # Parameters generated during traversals.  We initialize them
-        # here for error checking purposes
-        self.color = "none-set"
-        self.previous = None
-        self.distance = float('inf')
- 
 
     def connect(self, dest_node, weight=1): #HW
         """Connects this node to another node.
@@ -52,7 +66,7 @@ class GraphNode():
             raise Exception("An edge already exists")
         
         # check: dest_node is a graphnode
-        if not isinstance(dest_node, GraphNode):
+        if not isinstance(dest_node, CompactGraphNode):
             raise TypeError("dest_node must be an instance of GraphNode")
         
         # connects from current to dest
@@ -150,16 +164,140 @@ class GraphNode():
         self.back_edges.clear() #also del self's backedges
 
 
+class GraphNode(CompactGraphNode):
+    """The usual node, which also carries the color, previous and
+    distance that traversals run without a TraversalState leave
+    behind, along with any other attributes you care to set."""
+    stores_traversal = True
+
+    def __init__(self, name, data=None):
+        super().__init__(name, data)
+
+        # Parameters generated during traversals.  We initialize them
+        # here for error checking purposes
+        self.color = "none-set"
+        self.previous = None
+        self.distance = float('inf')
+
+
+class TraversalState():
+    """Per-query bookkeeping for a traversal.
+
+    Searches that take one of these keep their working values here,
+    in dictionaries keyed by node, rather than in the color, previous
+    and distance attributes on the nodes themselves.  That way the
+    search only touches the nodes it actually reaches.
+    """
+    def __init__(self):
+        self.color = {}
+        self.previous = {}
+        self.distance = {}
+
+    def path(self, node):
+        """The list of nodes from the root of the traversal to NODE,
+        following the previous links"""
+        path = [node]
+        while self.previous.get(path[-1]) is not None:
+            path.append(self.previous[path[-1]])
+        path.reverse()
+        return path
+
+
+class TraversalCounters():
+    """What one traversal did: the nodes it settled, the edges it
+    looked along, its priority queue operations, and how many nodes
+    had their distance reset before it started.  KIND names the
+    traversal ("dijkstra", "astar", "bidirectional", "bfs" or "dfs").
+    """
+    FIELDS = ("nodes_settled", "edges_relaxed", "heap_pushes", "heap_pops",
+              "distance_resets")
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.nodes_settled = 0
+        self.edges_relaxed = 0
+        self.heap_pushes = 0
+        self.heap_pops = 0
+        self.distance_resets = 0
+
+    def as_dict(self):
+        counters = {"kind": self.kind}
+        for field in self.FIELDS:
+            counters[field] = getattr(self, field)
+        return counters
+
+    def __repr__(self):
+        return "TraversalCounters({})".format(self.as_dict())
+
+
+class TraversalStats():
+    """Opt-in instrumentation for the traversals on a graph.
+
+    Setting graph.stats to one of these makes every traversal and
+    search on the graph fill in a TraversalCounters and hand it to
+    finish() when it is done (or abandoned).  CALLBACK, if given, is
+    called with each finished TraversalCounters, for example to feed a
+    metrics pipeline, and running totals are kept in self.totals.
+
+    With graph.stats left as None the only cost is a check for None.
+    """
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.traversals = 0
+        self.totals = TraversalCounters("total")
+
+    def start(self, kind):
+        return TraversalCounters(kind)
+
+    def finish(self, counters):
+        with self.lock:
+            self.traversals += 1
+            for field in TraversalCounters.FIELDS:
+                setattr(self.totals, field, getattr(self.totals, field) +
+                        getattr(counters, field))
+        if self.callback is not None:
+            self.callback(counters)
+
+
 class Graph():
     """This is effectively the graph code from the lecture.  Thanks to
     the abstractions for nodes, the code works with your new version
     as well
     """
-    def __init__(self, dictionary=None):
-        """Initializes a graph"""
+    def __init__(self, dictionary=None, node_class=GraphNode):
+        """Initializes a graph.  NODE_CLASS makes the nodes, and can be
+        CompactGraphNode to save memory on big graphs."""
         
         self.nodes = {}
+        self.node_class = node_class
+
+        # Callables told about every change made through the graph,
+        # see subscribe()
+        self.listeners = []
 
+        # Set to a TraversalStats to count what traversals do
+        self.stats = None
+
+        # With lazy_delete on, deleted nodes are only hidden and their
+        # edges are left in place until compact(), which runs once the
+        # tombstones (the hidden nodes) outnumber COMPACT_RATIO times
+        # the live nodes
+        self.lazy_delete = False
+        self.tombstones = set()
+        self.compact_ratio = 0.25
+
+        # The ConnectivityIndexes made by connectivity(), by directed
+        self.connectivity_indexes = {}
+
+        # Bumped by every change, see snapshot()
+        self.version = 0
+        # Weak references to the live snapshots, which take themselves
+        # out once collected
+        self.snapshots = set()
 
         if dictionary:
             for key in dictionary:
@@ -176,18 +314,246 @@ class Graph():
         return self.nodes[name]
 
     def __setitem__(self, name, data):
+        self.version += 1
         if name in self.nodes:
+            if self.snapshots:
+                self._copy_on_write((self.nodes[name],))
             self.nodes[name].data = data
         else:
-            self.nodes[name] = GraphNode(name, data)
+            if self.snapshots:
+                self._copy_on_write(added=(name,))
+            self.nodes[name] = self.node_class(name, data)
+            self._notify("add", name)
 
     def __delitem__(self, name):
         """For deleting nodes, we delete all the edges involved in a
         node first..."""
         if name not in self.nodes:
             raise IndexError("Unable to find {}".format(name))
-        self.nodes[name].del_all_edges()
+        if self.lazy_delete:
+            self.remove_nodes([name])
+            return
+        node = self.nodes[name]
+        self.version += 1
+        if self.snapshots:
+            self._copy_on_write(chain((node,), node.edges, node.back_edges),
+                                deleted=((name, node),))
+        node.del_all_edges()
         del self.nodes[name]
+        self._notify("delete", name)
+
+    def snapshot(self):
+        """A GraphSnapshot: a read-only view of the graph as it is now,
+        which stays that way however the graph changes afterwards.
+
+        Taking one is cheap, as it shares all the nodes with the graph.
+        From then on, the first change to a node's data or edges hands
+        the snapshot the node's current data and edge dictionaries and
+        gives the node fresh copies to change (copy on write), and added
+        and deleted names are noted, so a snapshot costs memory in
+        proportion to what changes while it is held.  The graph only
+        keeps weak references to its snapshots, so once the readers
+        drop one the versions it kept go with it.
+
+        Take snapshots on the thread making the changes, then hand them
+        to readers on other threads.  Only changes made through the
+        Graph are seen, not ones made on the nodes directly.
+        """
+        snapshot = GraphSnapshot(self)
+        self.snapshots.add(weakref.ref(snapshot, self.snapshots.discard))
+        return snapshot
+
+    def _copy_on_write(self, nodes=(), added=(), deleted=()):
+        """The write hook, called before every change made through the
+        graph while there are snapshots.  NODES are about to have their
+        data or edges changed, ADDED are names about to be added and
+        DELETED (name, node) pairs about to be deleted."""
+        snapshots = [ref() for ref in list(self.snapshots)]
+        snapshots = [snapshot for snapshot in snapshots if snapshot is not None]
+        for snapshot in snapshots:
+            for name in added:
+                snapshot._added(name)
+            for name, node in deleted:
+                snapshot._deleted(name, node)
+        for node in nodes:
+            kept = False
+            for snapshot in snapshots:
+                if snapshot._keep(node):
+                    kept = True
+            if kept:
+                node.edges = dict(node.edges)
+                node.back_edges = dict(node.back_edges)
+
+    def remove_nodes(self, names):
+        """Deletes all the nodes named in NAMES, and their edges, in one
+        go.
+
+        Deleting nodes one at a time looks up every neighbor once per
+        deleted node.  This gathers what each surviving neighbor loses
+        and visits it once, rebuilding its edge dictionary outright when
+        it loses most of it (which also gives back the memory, as
+        deleting from a dictionary never shrinks it), and skips the
+        edges between removed nodes entirely.  The work is in proportion
+        to the edges removed.
+
+        Nothing is removed unless every name is in the graph.  In
+        lazy_delete mode the nodes are just hidden, see compact().
+        """
+        names = list(dict.fromkeys(names))
+        for name in names:
+            if name not in self.nodes:
+                raise IndexError("Unable to find {}".format(name))
+        self.version += 1
+        if self.snapshots:
+            self._copy_on_write(deleted=[(name, self.nodes[name])
+                                         for name in names])
+        removed = [self.nodes.pop(name) for name in names]
+        if self.lazy_delete:
+            self.tombstones.update(removed)
+        else:
+            self._purge(removed)
+        if self.listeners:
+            for name in names:
+                self._notify("delete", name)
+        if (self.lazy_delete and
+                len(self.tombstones) > self.compact_ratio * len(self.nodes)):
+            self.compact()
+
+    def compact(self):
+        """Removes the edges of the nodes hidden by lazy deletes.
+
+        Until then a hidden node is gone from the graph (lookups,
+        iteration, len) and the traversals and searches step around it,
+        but it is still in its neighbors' edges and back_edges.  Run
+        this before reading those dictionaries directly."""
+        if self.tombstones:
+            dead = self.tombstones
+            self.tombstones = set()
+            self._purge(dead)
+
+    def _purge(self, removed):
+        removed = set(removed)
+        # Each surviving neighbor and the removed nodes it has to drop
+        lost_edges = {}
+        lost_back_edges = {}
+        for node in removed:
+            for dest in node.edges:
+                if dest not in removed:
+                    lost_back_edges.setdefault(dest, []).append(node)
+            for source in node.back_edges:
+                if source not in removed:
+                    lost_edges.setdefault(source, []).append(node)
+        if self.snapshots:
+            self._copy_on_write(chain(removed, lost_edges, lost_back_edges))
+        for attribute, lost in (("edges", lost_edges),
+                                ("back_edges", lost_back_edges)):
+            for node, gone in lost.items():
+                edges = getattr(node, attribute)
+                if 2 * len(gone) > len(edges):
+                    setattr(node, attribute,
+                            {dest: weight for dest, weight in edges.items()
+                             if dest not in removed})
+                else:
+                    for dest in gone:
+                        del edges[dest]
+        for node in removed:
+            node.edges.clear()
+            node.back_edges.clear()
+
+    def add_nodes(self, items):
+        """Adds (name, data) pairs in bulk.  Like graph[name] = data,
+        an existing node just gets its data replaced."""
+        nodes = self.nodes
+        listeners = self.listeners
+        snapshots = bool(self.snapshots)
+        self.version += 1
+        for name, data in items:
+            if name in nodes:
+                if snapshots:
+                    self._copy_on_write((nodes[name],))
+                nodes[name].data = data
+            else:
+                if snapshots:
+                    self._copy_on_write(added=(name,))
+                nodes[name] = self.node_class(name, data)
+                if listeners:
+                    self._notify("add", name)
+
+    def add_edges(self, edges, validate=True):
+        """Adds (source name, dest name, weight) triples in bulk.
+
+        With validate on, each edge gets the same checks as connect:
+        both nodes must exist and the edge must be new.  Trusted input
+        can turn that off to write straight into the edge dictionaries,
+        in which case a repeated edge replaces the weight and a missing
+        node raises a KeyError.  Listeners see a replaced edge as a
+        disconnect followed by a connect."""
+        nodes = self.nodes
+        listeners = self.listeners
+        snapshots = bool(self.snapshots)
+        self.version += 1
+        for source_name, dest_name, weight in edges:
+            if validate:
+                source = self[source_name]
+                dest = self[dest_name]
+                if dest in source.edges:
+                    raise Exception("An edge already exists")
+            else:
+                source = nodes[source_name]
+                dest = nodes[dest_name]
+            if snapshots:
+                self._copy_on_write((source, dest))
+            if listeners and dest in source.edges:
+                # Let them drop the old edge before they see the new one
+                del source.edges[dest]
+                del dest.back_edges[source]
+                self._notify("disconnect", source_name, dest_name)
+            source.edges[dest] = weight
+            dest.back_edges[source] = weight
+            if listeners:
+                self._notify("connect", source_name, dest_name, weight)
+
+    @classmethod
+    def from_edges(cls, edges, nodes=None, validate=True,
+                   node_class=GraphNode):
+        """Builds a graph from (source name, dest name, weight) triples,
+        creating nodes (with no data) as they are first mentioned.
+        NODES can give (name, data) pairs to add first."""
+        graph = cls(node_class=node_class)
+        if nodes is not None:
+            graph.add_nodes(nodes)
+        existing = graph.nodes
+
+        def with_nodes(edges):
+            for edge in edges:
+                if edge[0] not in existing:
+                    existing[edge[0]] = node_class(edge[0])
+                if edge[1] not in existing:
+                    existing[edge[1]] = node_class(edge[1])
+                yield edge
+        graph.add_edges(with_nodes(edges), validate)
+        return graph
+
+    def subscribe(self, listener):
+        """Registers LISTENER to be called after every change to the
+        graph's structure as listener(event, *args), with one of
+
+            ("add", name)
+            ("delete", name)      after the node and its edges are gone
+            ("connect", source_name, dest_name, weight)
+            ("disconnect", source_name, dest_name)
+
+        add_edges(validate=False) replacing an edge's weight sends a
+        disconnect and then a connect.  Only changes made through the Graph are reported, not ones
+        made by calling connect/disconnect on the nodes directly."""
+        self.listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        self.listeners.remove(listener)
+
+    def _notify(self, event, *args):
+        for listener in self.listeners:
+            listener(event, *args)
 
     def __contains__(self, name):
         return name in self.nodes
@@ -200,118 +566,571 @@ class Graph():
         """This will implicitly raise errors if nodes don't exist..."""
         source = self[source_name]
         dest = self[dest_name]
+        self.version += 1
+        if self.snapshots:
+            self._copy_on_write((source, dest))
         source.connect(dest, weight)
+        if self.listeners:
+            self._notify("connect", source_name, dest_name, weight)
 
     def disconnect(self, source_name, dest_name):
         source = self[source_name]
         dest = self[dest_name]
+        self.version += 1
+        if self.snapshots:
+            self._copy_on_write((source, dest))
         source.disconnect(dest)
+        if self.listeners:
+            self._notify("disconnect", source_name, dest_name)
         
     def connected(self, source_name, dest_name):
         source = self[source_name]
         dest = self[dest_name]
         return source.connected(dest)
         
+    def connectivity(self, directed=False):
+        """The graph's ConnectivityIndex, made the first time it is
+        asked for and kept up to date from then on.  DIRECTED is as for
+        ConnectivityIndex."""
+        index = self.connectivity_indexes.get(directed)
+        if index is None:
+            index = ConnectivityIndex(self, directed)
+            self.connectivity_indexes[directed] = index
+        return index
+
     def check_structure(self):
         """Will raise an assertion failure if it is not well formed"""
+        self.compact()
         for node in self.nodes:
             self.nodes[node]._check_structure()
         return True
 
 
-    def dijkstra_traversal(self, node_name):
+    def _traversal(self, kind, traversal, state):
+        """Runs a traversal generator that keeps its work in STATE.
+
+        With no state the traversal gets a fresh one and, as before,
+        leaves its results on the nodes: every node is reset first and
+        each node's color, previous and distance are copied over as it
+        comes out.  That mode changes the shared nodes, so concurrent
+        traversals of the same graph have to pass their own states.
+
+        Nodes that can't hold those results (CompactGraphNode) just get
+        a fresh state that is thrown away afterwards.
+
+        Nodes hidden by lazy deletes are marked black (done) in the
+        state before it starts, so the traversal never steps onto them.
+
+        The traversal is also handed the TraversalCounters to fill in
+        when stats are on, or None.
+        """
+        stats = self.stats
+        if state is None and not self.node_class.stores_traversal:
+            state = TraversalState()
+        if stats is None and state is not None:
+            self._hide_tombstones(state)
+            return traversal(state, None)
+        return self._run(kind, traversal, state, stats)
+
+    def _hide_tombstones(self, state):
+        color = state.color
+        for node in self.tombstones:
+            color[node] = "black"
+
+    def _run(self, kind, traversal, state, stats):
+        counts = stats.start(kind) if stats is not None else None
+        publish = state is None
+        if publish:
+            state = TraversalState()
+            for n in self.nodes:
+                self.nodes[n].color = "white"
+                self.nodes[n].previous = None
+                self.nodes[n].distance = float('inf')
+            if counts is not None:
+                counts.distance_resets += len(self.nodes)
+        self._hide_tombstones(state)
+        inner = traversal(state, counts)
+        try:
+            for node in inner:
+                if publish:
+                    node.color = state.color.get(node, "white")
+                    node.previous = state.previous.get(node)
+                    node.distance = state.distance.get(node, float('inf'))
+                yield node
+        finally:
+            inner.close()
+            if counts is not None:
+                stats.finish(counts)
+
+    def dijkstra_traversal(self, node_name, engine="heap", state=None):
         """This traversal is the shortest path traversal starting from
         the node.
 
         Note that it will return all nodes, even those who are not
         reachable from the starting node, but such nodes will have no
-        "previous" value."""
-        start = self.nodes[node_name]
+        "previous" value.
+
+        The default "heap" engine keeps a binary heap of tentative
+        distances with lazy deletion (stale entries are skipped when
+        popped), so a traversal is O((V+E) log V).  The original
+        "scan" engine, which searches the whole unvisited set for the
+        minimum on every step, is kept for comparison.
+
+        If a TraversalState is passed the distances and previous nodes
+        are recorded there and the nodes themselves are not touched."""
+        if engine == "heap":
+            return self._traversal("dijkstra",
+                                   partial(self._dijkstra_heap, node_name),
+                                   state)
+        if engine == "scan":
+            return self._traversal("dijkstra",
+                                   partial(self._dijkstra_scan, node_name),
+                                   state)
+        raise ValueError("Unknown dijkstra engine {}".format(engine))
+
+    def _dijkstra_heap(self, node_name, state, counts):
+        start = self[node_name]
+        color = state.color
+        previous = state.previous
+        distance = state.distance
+        distance[start] = 0
+        previous[start] = None
+        # The counter breaks ties so the heap never compares nodes
+        counter = count()
+        heap = [(0, next(counter), start)]
+        if counts is not None:
+            counts.heap_pushes += 1
+        while heap:
+            node_distance, _, min_node = heappop(heap)
+            if counts is not None:
+                counts.heap_pops += 1
+            if color.get(min_node) == "black":
+                continue
+            color[min_node] = "black"
+            if counts is not None:
+                counts.nodes_settled += 1
+                counts.edges_relaxed += len(min_node.edges)
+            for (dest, weight) in min_node.all_edges():
+                assert weight >= 0
+                if ( color.get(dest) != "black" and
+                     node_distance + weight < distance.get(dest, float('inf'))):
+                    distance[dest] = node_distance + weight
+                    previous[dest] = min_node
+                    color[dest] = "gray"
+                    heappush(heap, (distance[dest], next(counter), dest))
+                    if counts is not None:
+                        counts.heap_pushes += 1
+            yield min_node
+        # Whatever is left is unreachable and comes out last, at an
+        # infinite distance
+        for n in self.nodes:
+            node = self.nodes[n]
+            if color.get(node) != "black":
+                color[node] = "black"
+                yield node
+
+    def _dijkstra_scan(self, node_name, state, counts):
+        start = self[node_name]
+        color = state.color
+        previous = state.previous
+        distance = state.distance
         unvisited = set()
         for n in self.nodes:
-            self.nodes[n].distance = float('inf')
-            self.nodes[n].previous = None
+            distance[self.nodes[n]] = float('inf')
+            previous[self.nodes[n]] = None
             unvisited.add(self.nodes[n])
             for (dest, weight) in self.nodes[n].all_edges():
                 assert weight >= 0
-        start.distance = 0
+        if counts is not None:
+            counts.distance_resets += len(self.nodes)
+        distance[start] = 0
         while len(unvisited) > 0:
             min_node = None
             for node in unvisited:
                 if min_node == None:
                     min_node = node
-                if node.distance < min_node.distance:
+                if distance[node] < distance[min_node]:
                     min_node = node
 
             unvisited.remove(min_node)
+            color[min_node] = "black"
+            if counts is not None:
+                counts.nodes_settled += 1
+                counts.edges_relaxed += len(min_node.edges)
             for (dest, weight) in min_node.all_edges():
                 if ( dest in unvisited and
-                     min_node.distance + weight < dest.distance):
-                    dest.distance = min_node.distance + weight
-                    dest.previous = min_node
+                     distance[min_node] + weight < distance[dest]):
+                    distance[dest] = distance[min_node] + weight
+                    previous[dest] = min_node
             yield min_node
-            
-    def bfs_traversal(self, node_name):
 
+    def astar_search(self, source_name, dest_name, heuristic, state=None,
+                     path=True):
+        """A* point to point shortest path search.
+
+        HEURISTIC is called with a node and must return a lower bound
+        on the distance from that node to the destination.  If it is
+        also consistent (never drops by more than the weight of an edge)
+        each node is settled at most once and the search stops as soon
+        as the destination is settled.
+
+        Returns the list of node names from source to destination, or
+        [] if the destination can't be reached.  The distances and
+        previous links end up in STATE (a fresh TraversalState if none
+        is given) and the nodes themselves are left alone.  With PATH
+        off it just returns whether the destination was reached, and
+        the caller can follow STATE's previous links itself.
+        """
+        if state is None:
+            state = TraversalState()
+        start = self[source_name]
+        goal = self[dest_name]
+        self._hide_tombstones(state)
+        stats = self.stats
+        counts = stats.start("astar") if stats is not None else None
+        try:
+            reached = self._astar(start, goal, heuristic, state, counts)
+        finally:
+            if counts is not None:
+                stats.finish(counts)
+        if not path:
+            return reached
+        if not reached:
+            return []
+        return [n.name for n in state.path(goal)]
+
+    def _astar(self, start, goal, heuristic, state, counts):
+        color = state.color
+        previous = state.previous
+        distance = state.distance
+        counter = count()
+        distance[start] = 0
+        previous[start] = None
+        color[start] = "gray"
+        heap = [(heuristic(start), next(counter), start)]
+        if counts is not None:
+            counts.heap_pushes += 1
+        while heap:
+            _, _, node = heappop(heap)
+            if counts is not None:
+                counts.heap_pops += 1
+            if color[node] == "black":
+                continue
+            color[node] = "black"
+            if counts is not None:
+                counts.nodes_settled += 1
+            if node is goal:
+                return True
+            if counts is not None:
+                counts.edges_relaxed += len(node.edges)
+            for (dest, weight) in node.all_edges():
+                assert weight >= 0
+                if color.get(dest) == "black":
+                    continue
+                new_distance = distance[node] + weight
+                if new_distance < distance.get(dest, float('inf')):
+                    distance[dest] = new_distance
+                    previous[dest] = node
+                    color[dest] = "gray"
+                    heappush(heap, (new_distance + heuristic(dest),
+                                    next(counter), dest))
+                    if counts is not None:
+                        counts.heap_pushes += 1
+        return False
+
+    def bidirectional_search(self, source_name, dest_name, forward=None,
+                             backward=None):
+        """Bidirectional dijkstra point to point shortest path search.
+
+        One search grows out from the source over the edges and another
+        grows back from the destination over the back_edges, always
+        advancing whichever has the smaller frontier distance.  MU is
+        the best source->destination distance seen through an edge
+        joining the two, and the search stops once the two frontier
+        distances add up to at least MU, since no unseen path can beat
+        it.
+
+        Returns the list of node names from source to destination, or
+        [] if there is no path.  The two searches keep their state in
+        FORWARD and BACKWARD (fresh TraversalStates if not given), and
+        the nodes themselves are left alone.
+        """
+        if forward is None:
+            forward = TraversalState()
+        if backward is None:
+            backward = TraversalState()
+        start = self[source_name]
+        goal = self[dest_name]
+        if start is goal:
+            return [start.name]
+        stats = self.stats
+        counts = stats.start("bidirectional") if stats is not None else None
+        try:
+            meeting = self._bidirectional(start, goal, forward, backward,
+                                          counts)
+        finally:
+            if counts is not None:
+                stats.finish(counts)
+        if meeting is None:
+            return []
+        # The forward tree up to the meeting edge, then the backward
+        # tree down to the destination
+        tail, head = meeting
+        path = [n.name for n in forward.path(tail)]
+        while head is not None:
+            path.append(head.name)
+            head = backward.previous[head]
+        return path
+
+    def _bidirectional(self, start, goal, forward, backward, counts):
+        """Runs the two searches and returns the (tail, head) edge where
+        the best path crosses from one to the other, or None"""
+        counter = count()
+        dead = self.tombstones
+        sides = []
+        for state, origin, other in ((forward, start, backward),
+                                     (backward, goal, forward)):
+            state.distance[origin] = 0
+            state.previous[origin] = None
+            state.color[origin] = "gray"
+            sides.append((state, [(0, next(counter), origin)], other))
+        if counts is not None:
+            counts.heap_pushes += 2
+        mu = float('inf')
+        meeting = None
+        while sides[0][1] and sides[1][1]:
+            if sides[0][1][0][0] + sides[1][1][0][0] >= mu:
+                break
+            # Advance the side with the nearer frontier
+            index = 0 if sides[0][1][0][0] <= sides[1][1][0][0] else 1
+            state, heap, other = sides[index]
+            node_distance, _, node = heappop(heap)
+            if counts is not None:
+                counts.heap_pops += 1
+            if state.color[node] == "black":
+                continue
+            state.color[node] = "black"
+            edges = (node.all_edges() if index == 0
+                     else node.back_edges.items())
+            if counts is not None:
+                counts.nodes_settled += 1
+                counts.edges_relaxed += len(node.edges if index == 0
+                                            else node.back_edges)
+            for (dest, weight) in edges:
+                assert weight >= 0
+                if dest in dead:
+                    continue
+                new_distance = node_distance + weight
+                if new_distance < state.distance.get(dest, float('inf')):
+                    state.distance[dest] = new_distance
+                    state.previous[dest] = node
+                    state.color[dest] = "gray"
+                    heappush(heap, (new_distance, next(counter), dest))
+                    if counts is not None:
+                        counts.heap_pushes += 1
+                if dest in other.distance:
+                    through = new_distance + other.distance[dest]
+                    if through < mu:
+                        mu = through
+                        meeting = ((node, dest) if index == 0
+                                   else (dest, node))
+        return meeting
+
+    def bfs_traversal(self, node_name, state=None):
         """Does an iterative breadth first search traversal"""
-        for n in self.nodes:
-            self.nodes[n].color = "white"
-            self.nodes[n].previous = None
+        return self._traversal("bfs", partial(self._bfs, node_name), state)
+
+    def _bfs(self, node_name, state, counts):
+        color = state.color
+        previous = state.previous
         start_node = self[node_name]
         queue = deque()
-        start_node.color = "gray"
+        color[start_node] = "gray"
+        previous[start_node] = None
         queue.appendleft(start_node)
         while len(queue) != 0:
             node = queue.pop()
+            if counts is not None:
+                counts.nodes_settled += 1
+                counts.edges_relaxed += len(node.edges)
             for (dest, weight) in node.all_edges():
-                if dest.color == "white":
-                    dest.color = "gray"
-                    dest.previous = node
+                if dest not in color:
+                    color[dest] = "gray"
+                    previous[dest] = node
                     queue.appendleft(dest)
-            node.color = "black"
+            color[node] = "black"
             yield node
 
+    def dfs_iterative_traversal(self, node_name, state=None, pre=None,
+                                post=None):
+        """Does an iterative depth first search traversal.  Each node
+        discovers all its undiscovered neighbors at once, and they are
+        then finished last discovered first.  PRE and POST are as for
+        depth_first."""
+        return self._traversal("dfs", partial(
+            self._dfs, node_name, eager=True, pre=pre, post=post), state)
 
-    def dfs_iterative_traversal(self, node_name):
-        """Does an iterative depth first search traversal"""
-        for n in self.nodes:
-            self.nodes[n].color = "white"
-            self.nodes[n].previous = None
+    def dfs_traversal(self, node_name, state=None, pre=None, post=None):
+        """Does a depth first search traversal, in the order the old
+        recursive version took, but without recursing, so long chains
+        can't blow out the python stack.  PRE and POST are as for
+        depth_first."""
+        return self._traversal("dfs", partial(
+            self._dfs, node_name, pre=pre, post=post), state)
+
+    def _dfs(self, node_name, state, counts, eager=False, pre=None,
+             post=None):
         start_node = self[node_name]
-        queue = []
-        queue.append(start_node)
-        start_node.color = "gray"
-        while len(queue) != 0:
-            node = queue[len(queue)-1]
-            appended = False
-            for (dest, weight) in node.all_edges():
-                if dest.color == "white":
-                    dest.color = "gray"
-                    dest.previous = node
-                    queue.append(dest)
-                    appended = True
-            if not appended:
-                node = queue.pop()
-                node.color = "black"
+        yield from self.depth_first([start_node], state, counts, eager, pre,
+                                    post)
+
+    def depth_first(self, roots, state, counts=None, eager=False, pre=None,
+                    post=None):
+        """The depth first search engine behind the dfs traversals,
+        strongly_connected_components and topological_sort.
+
+        Searches from each of the ROOTS nodes not already reached,
+        yielding nodes in postorder, as they finish.  Each frame on the
+        stack keeps its own iterator over the node's edges, so every
+        edge is looked at once and the search is O(V+E) with no
+        recursion.  Normally the edges are followed one at a time, the
+        way a recursive search would.  EAGER instead discovers all of a
+        node's undiscovered neighbors as soon as it is reached and then
+        finishes them last discovered first.
+
+        PRE is called with each node as it is discovered (colored gray)
+        and POST as it finishes, just before it is colored black.  The
+        colors and previous links are kept in STATE, a TraversalState,
+        and COUNTS is a TraversalCounters to fill in or None.
+        """
+        color = state.color
+        previous = state.previous
+        for root in roots:
+            if root in color:
+                continue
+            color[root] = "gray"
+            previous[root] = None
+            if pre is not None:
+                pre(root)
+            if counts is not None:
+                counts.edges_relaxed += len(root.edges)
+            if eager:
+                stack = [root]
+                expanded = set()
+            else:
+                stack = [(root, iter(root.edges))]
+            while stack:
+                if eager:
+                    node = stack[-1]
+                    if node not in expanded:
+                        expanded.add(node)
+                        size = len(stack)
+                        for dest in node.edges:
+                            if dest not in color:
+                                color[dest] = "gray"
+                                previous[dest] = node
+                                if pre is not None:
+                                    pre(dest)
+                                if counts is not None:
+                                    counts.edges_relaxed += len(dest.edges)
+                                stack.append(dest)
+                        if len(stack) != size:
+                            continue
+                    expanded.discard(node)
+                else:
+                    node, edges = stack[-1]
+                    descended = False
+                    for dest in edges:
+                        if dest not in color:
+                            color[dest] = "gray"
+                            previous[dest] = node
+                            if pre is not None:
+                                pre(dest)
+                            if counts is not None:
+                                counts.edges_relaxed += len(dest.edges)
+                            stack.append((dest, iter(dest.edges)))
+                            descended = True
+                            break
+                    if descended:
+                        continue
+                stack.pop()
+                if post is not None:
+                    post(node)
+                color[node] = "black"
+                if counts is not None:
+                    counts.nodes_settled += 1
                 yield node
-            
-    def dfs_traversal(self, node_name):
-        """Does a depth first search traversal recursively.  Note that
-        this can sometimes blow out the python stack, so the iterative
-        one is perferred in practice"""
-        def dfs_internal(at):
-            at.color = "gray"
-            for (dest, edge) in at.all_edges():
-                if dest.color == "white":
-                    dest.previous = at
-                    yield from dfs_internal(dest)
-            at.color = "black"
-            yield at
-        for n in self.nodes:
-            self.nodes[n].color = "white"
-            self.nodes[n].previous = None
-        yield from dfs_internal(self.nodes[node_name])
-        
+
+    def strongly_connected_components(self):
+        """The strongly connected components, as lists of node names.
+
+        This is Tarjan's algorithm run on the depth_first engine, so it
+        copes with millions of nodes.  A component is listed before any
+        component with an edge into it, which is the reverse of a
+        topological order of the components."""
+        state = TraversalState()
+        self._hide_tombstones(state)
+        previous = state.previous
+        index = {}
+        low = {}
+        stack = []
+        on_stack = set()
+        components = []
+
+        def discovered(node):
+            index[node] = low[node] = len(index)
+            stack.append(node)
+            on_stack.add(node)
+
+        def finished(node):
+            node_low = low[node]
+            for dest in node.edges:
+                if dest in on_stack:
+                    # A child in the search tree passes up how far back
+                    # it reaches, any other edge just where it lands
+                    reach = (low[dest] if previous[dest] is node
+                             else index[dest])
+                    if reach < node_low:
+                        node_low = reach
+            low[node] = node_low
+            if node_low == index[node]:
+                component = []
+                while True:
+                    member = stack.pop()
+                    on_stack.discard(member)
+                    component.append(member.name)
+                    if member is node:
+                        break
+                components.append(component)
+
+        for _ in self.depth_first(list(self), state, pre=discovered,
+                                  post=finished):
+            pass
+        return components
+
+    def topological_sort(self):
+        """The node names ordered so every edge goes from an earlier
+        name to a later one.  Raises ValueError if the graph has a
+        cycle."""
+        state = TraversalState()
+        self._hide_tombstones(state)
+        color = state.color
+        order = []
+
+        def finished(node):
+            for dest in node.edges:
+                # Gray nodes are still being searched, so an edge back
+                # to one closes a cycle
+                if color[dest] == "gray":
+                    raise ValueError("The graph has a cycle through {}".format(
+                        dest.name))
+            order.append(node.name)
+
+        for _ in self.depth_first(list(self), state, post=finished):
+            pass
+        order.reverse()
+        return order
+
     def __len__(self):
         return len(self.nodes)
 
@@ -321,6 +1140,790 @@ class Graph():
                                     self.nodes)) + "}" 
 
 
+class SnapshotNode(CompactGraphNode):
+    """A node as a GraphSnapshot sees it.  Its data and edges are the
+    ones the underlying node had when the snapshot was taken, and the
+    edges lead to other SnapshotNodes of the same snapshot.
+
+    It only holds a weak reference to its snapshot, so it can't be
+    used once the snapshot is gone (that raises ReferenceError)."""
+    __slots__ = ("node", "snapshot")
+
+    def __init__(self, node, snapshot):
+        self.name = node.name
+        self.node = node
+        self.snapshot = snapshot
+
+    @property
+    def data(self):
+        return self.snapshot._version(self.node)[0]
+
+    @property
+    def edges(self):
+        return _SnapshotEdges(self.snapshot._version(self.node)[1],
+                              self.snapshot)
+
+    @property
+    def back_edges(self):
+        return _SnapshotEdges(self.snapshot._version(self.node)[2],
+                              self.snapshot)
+
+    def all_edges(self):
+        return self.edges.items()
+
+    def connect(self, dest_node, weight=1):
+        raise TypeError("Graph snapshots are read-only")
+
+    def disconnect(self, dest_node):
+        raise TypeError("Graph snapshots are read-only")
+
+    def del_all_edges(self):
+        raise TypeError("Graph snapshots are read-only")
+
+
+class _SnapshotEdges(Mapping):
+    """An edge dictionary of the graph as a GraphSnapshot sees it,
+    keyed by SnapshotNodes.  Nothing is copied: the nodes are looked up
+    as the edges are read."""
+    __slots__ = ("edges", "snapshot")
+
+    def __init__(self, edges, snapshot):
+        self.edges = edges
+        self.snapshot = snapshot
+
+    def __getitem__(self, view):
+        node = getattr(view, "node", None)
+        if node is None or node in self.snapshot.hidden:
+            raise KeyError(view)
+        return self.edges[node]
+
+    def __contains__(self, view):
+        node = getattr(view, "node", None)
+        return (node is not None and node in self.edges and
+                node not in self.snapshot.hidden)
+
+    def __iter__(self):
+        hidden = self.snapshot.hidden
+        view = self.snapshot._view
+        for node in self.edges:
+            if node not in hidden:
+                yield view(node)
+
+    def __len__(self):
+        hidden = self.snapshot.hidden
+        if not hidden:
+            return len(self.edges)
+        return sum(1 for node in self.edges if node not in hidden)
+
+    def items(self):
+        hidden = self.snapshot.hidden
+        view = self.snapshot._view
+        for node, weight in self.edges.items():
+            if node not in hidden:
+                yield view(node), weight
+
+
+class _SnapshotNodes(Mapping):
+    """The name to node mapping of a GraphSnapshot: the graph's current
+    nodes, less the names added since and plus the ones deleted since"""
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+
+    def __getitem__(self, name):
+        snapshot = self.snapshot
+        # Look at the graph before the changes noted since, which are
+        # always noted before the graph changes
+        node = snapshot.graph.nodes.get(name)
+        deleted = snapshot.deleted.get(name)
+        if deleted is not None:
+            node = deleted
+        elif node is None or name in snapshot.added:
+            raise KeyError(name)
+        return snapshot._view(node)
+
+    def __iter__(self):
+        snapshot = self.snapshot
+        names = list(snapshot.graph.nodes)
+        added = set(snapshot.added)
+        deleted = dict(snapshot.deleted)
+        for name in names:
+            if name not in added and name not in deleted:
+                yield name
+        yield from deleted
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+class GraphSnapshot(Graph):
+    """A read-only view of a Graph as it was when graph.snapshot() was
+    called.
+
+    Everything that only reads a Graph works on it, traversals and
+    searches included, as do CSRGraph.from_graph and
+    ContractionHierarchy.  Its nodes are SnapshotNodes standing in for
+    the graph's nodes, made as they are first reached, and their edges
+    are read through to the graph's edge dictionaries.  Anything that
+    would change it raises TypeError.  VERSION is the graph's version
+    at the time.
+
+    Nothing in it refers back to it strongly, so it goes away as soon
+    as the last reader drops it, and the graph stops saving versions
+    for it.
+    """
+    def __init__(self, graph):
+        super().__init__(node_class=SnapshotNode)
+        self.graph = graph
+        self.version = graph.version
+        # node -> (data, edges, back_edges) as they were, for the nodes
+        # changed since
+        self.saved = {}
+        self.added = set()
+        self.deleted = {}
+        # Nodes already lazily deleted, which are still in the edges
+        self.hidden = frozenset(graph.tombstones)
+        # What the nodes and views hold instead of the snapshot itself
+        self.proxy = weakref.proxy(self)
+        self.views = {}
+        self.nodes = _SnapshotNodes(self.proxy)
+
+    def _added(self, name):
+        if name not in self.deleted:
+            self.added.add(name)
+
+    def _deleted(self, name, node):
+        if name not in self.added and name not in self.deleted:
+            self.deleted[name] = node
+
+    def _keep(self, node):
+        """Saves NODE's current version unless one is already saved,
+        returning whether it did"""
+        if node in self.saved:
+            return False
+        self.saved[node] = (node.data, node.edges, node.back_edges)
+        return True
+
+    def _version(self, node):
+        # Read the node before looking for a saved version, since a
+        # version is always saved before the node changes
+        current = (node.data, node.edges, node.back_edges)
+        return self.saved.get(node, current)
+
+    def _view(self, node):
+        view = self.views.get(node)
+        if view is None:
+            view = self.views.setdefault(node, SnapshotNode(node,
+                                                            self.proxy))
+        return view
+
+    def snapshot(self):
+        return self
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("Graph snapshots are read-only")
+
+    __setitem__ = __delitem__ = _read_only
+    add_nodes = add_edges = remove_nodes = _read_only
+    connect = disconnect = _read_only
+
+
+class DynamicShortestPathTree():
+    """The shortest path tree from one source node, kept up to date as
+    the graph changes.
+
+    The tree subscribes to the graph and repairs itself after each
+    change instead of rerunning dijkstra_traversal, in the style of
+    Ramalingam and Reps: a new edge that shortens the way to its
+    destination starts a dijkstra that only spreads through the nodes
+    that got closer, and removing a tree edge or node only recomputes
+    the subtree that hung below it, seeded from the back edges of the
+    nodes in that subtree.
+
+    Nodes are tracked by name.  Call close() to stop following the
+    graph.
+    """
+    def __init__(self, graph, source_name):
+        self.graph = graph
+        self.source = source_name
+        self.distance = {}
+        self.previous = {}
+        self.children = {}
+        state = TraversalState()
+        for node in graph.dijkstra_traversal(source_name, state=state):
+            if node not in state.distance:
+                break
+            self._attach(node.name, state.distance[node],
+                         state.previous[node].name
+                         if state.previous[node] is not None else None)
+        graph.subscribe(self._changed)
+
+    def close(self):
+        self.graph.unsubscribe(self._changed)
+
+    def distance_to(self, name):
+        """The shortest distance from the source, inf if unreachable"""
+        return self.distance.get(name, float('inf'))
+
+    def path_to(self, name):
+        """The list of names from the source to NAME, or [] if NAME
+        can't be reached"""
+        if name not in self.distance:
+            return []
+        path = [name]
+        while self.previous[path[-1]] is not None:
+            path.append(self.previous[path[-1]])
+        path.reverse()
+        return path
+
+    def _attach(self, name, distance, previous):
+        self.distance[name] = distance
+        self.previous[name] = previous
+        self.children.setdefault(name, set())
+        if previous is not None:
+            self.children[previous].add(name)
+
+    def _detach(self, name):
+        previous = self.previous.pop(name)
+        if previous is not None and previous in self.children:
+            self.children[previous].discard(name)
+        del self.distance[name]
+
+    def _changed(self, event, *args):
+        if event == "connect":
+            self._edge_added(*args)
+        elif event == "disconnect":
+            source_name, dest_name = args
+            if self.previous.get(dest_name, self) == source_name:
+                self._repair(self._subtree(dest_name))
+        elif event == "delete":
+            name = args[0]
+            if name == self.source:
+                self.distance.clear()
+                self.previous.clear()
+                self.children.clear()
+            elif name in self.distance:
+                affected = self._subtree(name)
+                affected.discard(name)
+                self._detach(name)
+                del self.children[name]
+                # remove_nodes sends its events once the whole batch is
+                # gone, so some of the subtree may already be deleted
+                gone = {at for at in affected if at not in self.graph.nodes}
+                for at in gone:
+                    self._detach(at)
+                    del self.children[at]
+                self._repair(affected - gone)
+
+    def _subtree(self, name):
+        subtree = set()
+        stack = [name]
+        while stack:
+            at = stack.pop()
+            subtree.add(at)
+            stack.extend(self.children.get(at, ()))
+        return subtree
+
+    def _edge_added(self, source_name, dest_name, weight):
+        if source_name not in self.distance:
+            return
+        new_distance = self.distance[source_name] + weight
+        if new_distance >= self.distance_to(dest_name):
+            return
+        # Lazily deleted nodes linger in the edges until compaction, and
+        # a new node may already be using the name
+        dead = self.graph.tombstones
+        counter = count()
+        heap = [(new_distance, next(counter), dest_name, source_name)]
+        while heap:
+            distance, _, name, previous = heappop(heap)
+            if distance >= self.distance_to(name):
+                continue
+            if name in self.distance:
+                self._detach(name)
+            self._attach(name, distance, previous)
+            for (dest, w) in self.graph[name].all_edges():
+                if dest in dead:
+                    continue
+                if distance + w < self.distance_to(dest.name):
+                    heappush(heap, (distance + w, next(counter),
+                                    dest.name, name))
+
+    def _repair(self, affected):
+        """Recomputes the distances of the AFFECTED nodes, a subtree
+        cut off from the rest of the tree"""
+        for name in affected:
+            self._detach(name)
+        for name in affected:
+            self.children[name] = set()
+        dead = self.graph.tombstones
+        counter = count()
+        heap = []
+        for name in affected:
+            for (source, w) in self.graph[name].back_edges.items():
+                if source.name in self.distance and source not in dead:
+                    heappush(heap, (self.distance[source.name] + w,
+                                    next(counter), name, source.name))
+        while heap:
+            distance, _, name, previous = heappop(heap)
+            if name in self.distance:
+                continue
+            self._attach(name, distance, previous)
+            for (dest, w) in self.graph[name].all_edges():
+                if (dest.name in affected and dest.name not in self.distance
+                        and dest not in dead):
+                    heappush(heap, (distance + w, next(counter),
+                                    dest.name, name))
+        for name in affected:
+            if name not in self.distance:
+                del self.children[name]
+
+
+class ConnectivityIndex():
+    """Which nodes of a graph can possibly reach which, answered
+    without a search.
+
+    Undirected (the default, for graphs like jump graphs where every
+    edge has a matching edge back) this is a union-find over the edges:
+    two nodes can reach each other exactly when they have the same
+    component.  A new edge just merges two components.
+
+    DIRECTED keeps the same union-find, which ignores edge direction
+    (so different components still rule a path out), plus the strongly
+    connected components, labelled so that an edge only ever goes from
+    a higher label to a lower or equal one.  Two nodes in the same
+    strong component reach each other, and a path can only go from a
+    label down to a smaller one.  A new edge that goes the other way
+    may merge strong components, so they are worked out again.
+
+    The index subscribes to the graph.  Removing edges or nodes can
+    split components, which union-find can't undo, so those just mark
+    it stale and it is rebuilt, in O(V+E), the next time it is asked.
+    Call close() to stop following the graph.
+    """
+    def __init__(self, graph, directed=False):
+        self.graph = graph
+        self.directed = directed
+        self.stale = True
+        self.strong_stale = True
+        self.rebuilds = 0
+        graph.subscribe(self._changed)
+
+    def close(self):
+        """Stops following the graph.  If this was the graph's own index
+        its connectivity() makes a fresh one next time."""
+        self.graph.unsubscribe(self._changed)
+        if self.graph.connectivity_indexes.get(self.directed) is self:
+            del self.graph.connectivity_indexes[self.directed]
+
+    def _changed(self, event, *args):
+        if self.stale:
+            return
+        if event == "add":
+            self.parent[args[0]] = args[0]
+            self.size[args[0]] = 1
+            if not self.strong_stale:
+                self.strong[args[0]] = self.labels
+                self.labels += 1
+        elif event == "connect":
+            source_name, dest_name = args[0], args[1]
+            self._union(source_name, dest_name)
+            if (not self.strong_stale and
+                    self.strong[source_name] < self.strong[dest_name]):
+                self.strong_stale = True
+        else:
+            self.stale = True
+
+    def _find(self, name):
+        parent = self.parent
+        while parent[name] != name:
+            # Path halving
+            parent[name] = parent[parent[name]]
+            name = parent[name]
+        return name
+
+    def _union(self, name1, name2):
+        root1 = self._find(name1)
+        root2 = self._find(name2)
+        if root1 == root2:
+            return
+        if self.size[root1] < self.size[root2]:
+            root1, root2 = root2, root1
+        self.parent[root2] = root1
+        self.size[root1] += self.size[root2]
+
+    def _refresh(self):
+        if self.stale:
+            self.parent = {name: name for name in self.graph.nodes}
+            self.size = dict.fromkeys(self.parent, 1)
+            dead = self.graph.tombstones
+            for node in self.graph:
+                for dest in node.edges:
+                    if dest not in dead:
+                        self._union(node.name, dest.name)
+            self.stale = False
+            self.strong_stale = True
+            self.rebuilds += 1
+        if self.directed and self.strong_stale:
+            self.strong, self.labels = self._strong_components()
+            self.strong_stale = False
+
+    def _strong_components(self):
+        """Labels the strong components by their place in the list
+        strongly_connected_components returns, which puts every edge
+        between two of them from a higher label to a lower one"""
+        labels = {}
+        components = self.graph.strongly_connected_components()
+        for label, component in enumerate(components):
+            for name in component:
+                labels[name] = label
+        return labels, len(components)
+
+    def current(self):
+        """Whether the index can answer without being rebuilt"""
+        return not self.stale and not (self.directed and self.strong_stale)
+
+    def _check(self, *names):
+        for name in names:
+            if name not in self.graph.nodes:
+                raise IndexError("Unable to find {}".format(name))
+        self._refresh()
+
+    def component(self, name):
+        """A label for NAME's component: the union-find root, or when
+        directed the strong component's number"""
+        self._check(name)
+        if self.directed:
+            return self.strong[name]
+        return self._find(name)
+
+    def same_component(self, name1, name2):
+        """Whether the two nodes can reach each other"""
+        return self.component(name1) == self.component(name2)
+
+    def may_reach(self, source_name, dest_name):
+        """False if there is certainly no path from the source to the
+        destination.  Undirected, True means there is one.  Directed,
+        True only means one wasn't ruled out, unless same_component
+        says so too."""
+        self._check(source_name, dest_name)
+        if self._find(source_name) != self._find(dest_name):
+            return False
+        if self.directed:
+            return self.strong[source_name] >= self.strong[dest_name]
+        return True
+
+
+class IndexedTraversalState():
+    """Per-query bookkeeping for a traversal over a CSRGraph.
+
+    Nodes there are small integers, so instead of dictionaries the
+    state is three flat arrays indexed by node id.  A previous value of
+    -1 means there is no previous node.
+    """
+    WHITE, GRAY, BLACK = 0, 1, 2
+
+    def __init__(self, size):
+        self.color = bytearray(size)
+        self.previous = array('q', [-1]) * size
+        self.distance = array('d', [float('inf')]) * size
+
+    def path(self, node):
+        """The list of node ids from the root of the traversal to NODE"""
+        path = [node]
+        while self.previous[path[-1]] != -1:
+            path.append(self.previous[path[-1]])
+        path.reverse()
+        return path
+
+
+class CSRGraph():
+    """A frozen, array backed version of a Graph for read-mostly work.
+
+    The nodes are numbered 0..N-1 and the edges are stored in
+    compressed sparse row form: the out edges of node i are
+    targets[offsets[i]:offsets[i+1]] with the matching weights in
+    weights[offsets[i]:offsets[i+1]].  The back edges are kept the same
+    way in back_offsets/back_sources, with back_edge_ids pointing at the
+    forward edge so the weight isn't stored twice.  With no per node
+    objects or dictionaries an edge costs 20 bytes.
+
+    The traversals work like the ones on Graph but yield node ids, and
+    since the graph can't be changed they keep their state in an
+    IndexedTraversalState rather than on the nodes.
+
+    Any sequences that index like arrays will do for the CSR, such as
+    memoryviews over a memory mapped file.  The reverse CSR is worked
+    out from the forward one unless BACK gives the (back_offsets,
+    back_sources, back_edge_ids) arrays.
+    """
+    def __init__(self, names, offsets, targets, weights, data=None,
+                 back=None):
+        if len(offsets) != len(names) + 1:
+            raise ValueError("Need one more offset than there are nodes")
+        if len(targets) != offsets[-1] or len(weights) != offsets[-1]:
+            raise ValueError("Edge arrays don't match the offsets")
+        self.names = names
+        self.data = data
+        self._ids = None
+        self.offsets = offsets
+        self.targets = targets
+        self.weights = weights
+        if back is None:
+            back = self._reverse()
+        (self.back_offsets, self.back_sources, self.back_edge_ids) = back
+
+    @property
+    def ids(self):
+        """The dictionary from name to node id, built the first time
+        it's needed"""
+        if self._ids is None:
+            self._ids = {name: i for i, name in enumerate(self.names)}
+        return self._ids
+
+    @classmethod
+    def from_edges(cls, names, edges, data=None):
+        """Builds the graph from a list of node names and an iterable
+        of (source id, destination id, weight) triples.  There should
+        be at most one edge for each source and destination."""
+        size = len(names)
+        sources = array('q')
+        targets = array(_id_typecode(size))
+        weights = array('d')
+        for source, dest, weight in edges:
+            if not (0 <= source < size and 0 <= dest < size):
+                raise IndexError("Edge {}->{} is out of range".format(
+                    source, dest))
+            assert weight >= 0
+            sources.append(source)
+            targets.append(dest)
+            weights.append(weight)
+        offsets, order = _bucket(sources, size)
+        return cls(names, offsets,
+                   array(targets.typecode, (targets[k] for k in order)),
+                   array('d', (weights[k] for k in order)), data)
+
+    @classmethod
+    def from_graph(cls, graph):
+        """Freezes a Graph, keeping its node names, data and edges"""
+        graph.compact()
+        names = list(graph.nodes)
+        ids = {name: i for i, name in enumerate(names)}
+        data = [graph.nodes[name].data for name in names]
+        total = sum(len(graph.nodes[name].edges) for name in names)
+        # Sized up front, appending would over-allocate the arrays
+        offsets = array(_id_typecode(total), [0]) * (len(names) + 1)
+        targets = array(_id_typecode(len(names)), [0]) * total
+        weights = array('d', [0]) * total
+        k = 0
+        for i, name in enumerate(names):
+            for dest, weight in graph.nodes[name].all_edges():
+                targets[k] = ids[dest.name]
+                weights[k] = weight
+                k += 1
+            offsets[i + 1] = k
+        return cls(names, offsets, targets, weights, data)
+
+    def _reverse(self):
+        size = len(self.names)
+        sources = array('q')
+        for i in range(size):
+            sources.extend([i] * (self.offsets[i + 1] - self.offsets[i]))
+        back_offsets, order = _bucket(self.targets, size)
+        return (back_offsets,
+                array(self.targets.typecode, (sources[k] for k in order)),
+                array(_id_typecode(len(order)), order))
+
+    def __reduce__(self):
+        # Only the forward arrays are shipped, the name index and the
+        # reverse CSR are rebuilt on the other side
+        return (self.__class__, (list(self.names), _as_array(self.offsets),
+                                 _as_array(self.targets),
+                                 _as_array(self.weights), self.data))
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.ids
+
+    def id(self, name):
+        """The node id for a name"""
+        if name not in self.ids:
+            raise IndexError("Unable to find {}".format(name))
+        return self.ids[name]
+
+    def edge_count(self):
+        return len(self.targets)
+
+    def all_edges(self, node):
+        """Iterates over (destination id, weight) for node id NODE"""
+        start, end = self.offsets[node], self.offsets[node + 1]
+        return zip(self.targets[start:end], self.weights[start:end])
+
+    def all_back_edges(self, node):
+        """Iterates over (source id, weight) for edges into NODE"""
+        start, end = self.back_offsets[node], self.back_offsets[node + 1]
+        weights = self.weights
+        return zip(self.back_sources[start:end],
+                   (weights[k] for k in self.back_edge_ids[start:end]))
+
+    def connected(self, source_name, dest_name):
+        """Scans the source's out edges, so this is linear in its
+        degree rather than constant time"""
+        source = self.id(source_name)
+        dest = self.id(dest_name)
+        start, end = self.offsets[source], self.offsets[source + 1]
+        return dest in self.targets[start:end]
+
+    def bfs_traversal(self, node_name, state=None):
+        """Does an iterative breadth first search traversal"""
+        if state is None:
+            state = IndexedTraversalState(len(self))
+        color = state.color
+        previous = state.previous
+        offsets = self.offsets
+        targets = self.targets
+        start_node = self.id(node_name)
+        queue = deque()
+        color[start_node] = state.GRAY
+        queue.appendleft(start_node)
+        while len(queue) != 0:
+            node = queue.pop()
+            for k in range(offsets[node], offsets[node + 1]):
+                dest = targets[k]
+                if color[dest] == state.WHITE:
+                    color[dest] = state.GRAY
+                    previous[dest] = node
+                    queue.appendleft(dest)
+            color[node] = state.BLACK
+            yield node
+
+    def dfs_iterative_traversal(self, node_name, state=None):
+        """Does an iterative depth first search traversal, in the same
+        order as Graph.dfs_iterative_traversal.  Each node's edges are
+        only scanned once."""
+        if state is None:
+            state = IndexedTraversalState(len(self))
+        color = state.color
+        previous = state.previous
+        offsets = self.offsets
+        targets = self.targets
+        start_node = self.id(node_name)
+        color[start_node] = state.GRAY
+        stack = [start_node]
+        expanded = bytearray(len(self))
+        while len(stack) != 0:
+            node = stack[-1]
+            if not expanded[node]:
+                expanded[node] = 1
+                appended = False
+                for k in range(offsets[node], offsets[node + 1]):
+                    dest = targets[k]
+                    if color[dest] == state.WHITE:
+                        color[dest] = state.GRAY
+                        previous[dest] = node
+                        stack.append(dest)
+                        appended = True
+                if appended:
+                    continue
+            stack.pop()
+            color[node] = state.BLACK
+            yield node
+
+    def dfs_traversal(self, node_name, state=None):
+        """Does a depth first search traversal in the same order as the
+        recursive Graph.dfs_traversal, but with an explicit stack of
+        (node, next edge) frames so it can't blow out the python stack"""
+        if state is None:
+            state = IndexedTraversalState(len(self))
+        color = state.color
+        previous = state.previous
+        offsets = self.offsets
+        targets = self.targets
+        start_node = self.id(node_name)
+        color[start_node] = state.GRAY
+        stack = [[start_node, offsets[start_node]]]
+        while len(stack) != 0:
+            frame = stack[-1]
+            node, k = frame
+            if k < offsets[node + 1]:
+                frame[1] = k + 1
+                dest = targets[k]
+                if color[dest] == state.WHITE:
+                    color[dest] = state.GRAY
+                    previous[dest] = node
+                    stack.append([dest, offsets[dest]])
+            else:
+                stack.pop()
+                color[node] = state.BLACK
+                yield node
+
+    def dijkstra_traversal(self, node_name, state=None):
+        """The shortest path traversal, yielding node ids in order of
+        distance and then any unreachable ones, just like
+        Graph.dijkstra_traversal"""
+        if state is None:
+            state = IndexedTraversalState(len(self))
+        color = state.color
+        previous = state.previous
+        distance = state.distance
+        offsets = self.offsets
+        targets = self.targets
+        weights = self.weights
+        start = self.id(node_name)
+        distance[start] = 0
+        heap = [(0, start)]
+        while heap:
+            node_distance, node = heappop(heap)
+            if color[node] == state.BLACK:
+                continue
+            color[node] = state.BLACK
+            for k in range(offsets[node], offsets[node + 1]):
+                dest = targets[k]
+                new_distance = node_distance + weights[k]
+                if (color[dest] != state.BLACK and
+                        new_distance < distance[dest]):
+                    distance[dest] = new_distance
+                    previous[dest] = node
+                    heappush(heap, (new_distance, dest))
+            yield node
+        for node in range(len(self)):
+            if color[node] != state.BLACK:
+                yield node
+
+    def __repr__(self):
+        return "<CSRGraph {} nodes, {} edges>".format(len(self),
+                                                     self.edge_count())
+
+
+def _id_typecode(size):
+    """The smallest array typecode that can hold ids below SIZE"""
+    return 'i' if size < 2 ** 31 else 'q'
+
+
+def _as_array(values):
+    """Copies a memoryview into an array, so it can be pickled"""
+    if isinstance(values, array):
+        return values
+    return array(values.format, values)
+
+
+def _bucket(keys, size):
+    """A counting sort of the positions in KEYS by their key, returning
+    the CSR offsets and the sorted order of the positions"""
+    counts = array(_id_typecode(len(keys)), [0]) * (size + 1)
+    for key in keys:
+        counts[key + 1] += 1
+    for i in range(size):
+        counts[i + 1] += counts[i]
+    fill = array(counts.typecode, counts)
+    order = array('q', [0]) * len(keys)
+    for position, key in enumerate(keys):
+        order[fill[key]] = position
+        fill[key] += 1
+    return counts, order
+
+
 def make_star():
     """A basic test graph of a star"""
     g = Graph()
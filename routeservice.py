@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+
+"""An asyncio front end for answering route queries.
+
+traverse_starmap builds a graph and searches it on the calling thread,
+so calling it from a coroutine stalls every other client of the event
+loop until it is done.  RouteService does that work in an executor
+instead, and cuts it down where it can:
+
+  * Identical queries that are already in flight share one answer.
+  * Queries from the same star are answered by a single shortest path
+    traversal.  A batch gathers queries for at least BATCH_DELAY
+    seconds and for as long as it waits for one of the MAX_TRAVERSALS
+    traversal slots, so the busier the service the bigger the batches.
+  * The jump graph for each jumpdrive is built once, as a CSRGraph,
+    and kept for later queries, up to MAX_GRAPHS of the most recently
+    used ones.
+
+    service = RouteService(starmap)
+    path = await service.route("Sol", "Alpha Centauri", 10)
+"""
+
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from starmap import build_jump_csr, _routes_from
+
+
+class RouteServiceBusy(Exception):
+    """Raised by RouteService.route when too many queries are already
+    waiting for a slot"""
+
+
+def _build_graph(starmap, jumpdrive):
+    graph = build_jump_csr(starmap, jumpdrive)
+    # Build the name index here too, not on the event loop
+    graph.ids
+    return graph
+
+
+class RouteService():
+    """Answers route queries from coroutines without blocking the
+    event loop.
+
+    At most MAX_PENDING distinct queries are worked on at once, and
+    the rest wait their turn.  If MAX_WAITING is set, a query that
+    would make more than that many wait raises RouteServiceBusy instead,
+    so an overloaded server can turn clients away rather than queue
+    without bound.  Each jumpdrive asked for takes a whole jump graph,
+    so only the MAX_GRAPHS most recently used are kept.
+
+    The work runs in EXECUTOR, a ThreadPoolExecutor of our own if none
+    is given.  Threads keep the event loop free but share one core for
+    the traversals, which is why running more than a couple at once
+    doesn't pay.  For raw throughput over many cores use batch_routes
+    instead.  The starmap must not change while the service is in use.
+    """
+    def __init__(self, starmap, executor=None, max_pending=256,
+                 max_waiting=None, batch_delay=0.001, max_traversals=2,
+                 max_graphs=4):
+        if max_pending < 1 or max_traversals < 1 or max_graphs < 1:
+            raise ValueError("max_pending, max_traversals and max_graphs "
+                             "must be at least 1")
+        self.starmap = starmap
+        self.own_executor = executor is None
+        self.executor = executor if executor is not None else \
+            ThreadPoolExecutor(max_workers=max_traversals + 1)
+        self.max_pending = max_pending
+        self.max_waiting = max_waiting
+        self.batch_delay = batch_delay
+        self.max_graphs = max_graphs
+        self.slots = asyncio.Semaphore(max_pending)
+        self.traversal_slots = asyncio.Semaphore(max_traversals)
+        # The tasks running batches, held so they aren't collected
+        self.batch_tasks = set()
+        # jumpdrive -> future of its CSRGraph, least recently used first
+        self.graphs = OrderedDict()
+        # (start, end, jumpdrive) -> task answering it
+        self.in_flight = {}
+        # (start, jumpdrive) -> {end: future} gathering the next batch
+        self.batches = {}
+        # Distinct queries admitted or waiting for a slot
+        self.queued = 0
+        self.queries = 0
+        self.coalesced = 0
+        self.traversals = 0
+        self.rejected = 0
+
+    async def route(self, start, end, jumpdrive):
+        """The same list traverse_starmap(starmap, start, end, jumpdrive)
+        would return.  Like it, raises IndexError if START isn't in the
+        starmap and returns [] if END isn't."""
+        key = (start, end, jumpdrive)
+        task = self.in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            if (self.max_waiting is not None and
+                    self.queued >= self.max_pending + self.max_waiting):
+                self.rejected += 1
+                raise RouteServiceBusy(
+                    "{} route queries already waiting".format(
+                        self.queued - self.max_pending))
+            self.queries += 1
+            self.queued += 1
+            task = asyncio.ensure_future(self._query(start, end, jumpdrive))
+            self.in_flight[key] = task
+            task.add_done_callback(partial(self._finished, key))
+        # A caller giving up mustn't cancel the query for the others
+        # sharing it
+        return list(await asyncio.shield(task))
+
+    def _finished(self, key, task):
+        del self.in_flight[key]
+        self.queued -= 1
+
+    async def _query(self, start, end, jumpdrive):
+        async with self.slots:
+            graph = await self._graph(jumpdrive)
+            if start not in graph:
+                raise IndexError("Unable to find {}".format(start))
+            if end not in graph:
+                return []
+            return await self._batched(start, end, jumpdrive, graph)
+
+    async def _graph(self, jumpdrive):
+        future = self.graphs.get(jumpdrive)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self.executor, _build_graph,
+                                          self.starmap, jumpdrive)
+            self.graphs[jumpdrive] = future
+            # Queries already holding an evicted graph keep using it
+            if len(self.graphs) > self.max_graphs:
+                self.graphs.popitem(last=False)
+        else:
+            self.graphs.move_to_end(jumpdrive)
+        try:
+            return await asyncio.shield(future)
+        except Exception:
+            # Let the next query try again
+            if self.graphs.get(jumpdrive) is future:
+                del self.graphs[jumpdrive]
+            raise
+
+    def _batched(self, start, end, jumpdrive, graph):
+        """A future for the route, joining the batch of queries from
+        START that is still gathering or starting a new one on GRAPH"""
+        key = (start, jumpdrive)
+        batch = self.batches.get(key)
+        if batch is None:
+            batch = self.batches[key] = {}
+            task = asyncio.ensure_future(self._run_batch(key, graph))
+            self.batch_tasks.add(task)
+            task.add_done_callback(self.batch_tasks.discard)
+        if end not in batch:
+            batch[end] = asyncio.get_running_loop().create_future()
+        return batch[end]
+
+    async def _run_batch(self, key, graph):
+        await asyncio.sleep(self.batch_delay)
+        async with self.traversal_slots:
+            # Until here the batch was still taking more queries
+            batch = self.batches.pop(key)
+            start = key[0]
+            self.traversals += 1
+            try:
+                _, routes = await asyncio.get_running_loop().run_in_executor(
+                    self.executor, _routes_from, start, set(batch), graph)
+            except asyncio.CancelledError:
+                for future in batch.values():
+                    future.cancel()
+                raise
+            except Exception as e:
+                for future in batch.values():
+                    if not future.done():
+                        future.set_exception(e)
+                return
+        for end, future in batch.items():
+            if not future.done():
+                future.set_result(routes[end])
+
+    def close(self):
+        """Shuts down the executor if the service made it"""
+        if self.own_executor:
+            self.executor.shutdown(wait=False)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
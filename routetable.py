@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+
+"""All pairs route tables for small, dense starmaps.
+
+A RouteTable holds the shortest distance between every pair of stars
+and, for every pair, the first star to jump to on the way.  Building it
+runs one shortest path traversal per star, but afterwards a route is
+just a matter of following next hops, so a query costs time in
+proportion to the length of the route.
+
+The table takes N*N entries of each, so it only suits maps of a few
+thousand stars: 10,000 stars take about 600MB.
+"""
+
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from heapq import heappush, heappop
+import pickle
+
+import starmap as _starmap
+
+
+def _hop_typecode(size):
+    """The smallest unsigned array typecode that can hold node ids up
+    to SIZE, which marks "no route" """
+    for typecode in ('B', 'H', 'I', 'L', 'Q'):
+        if size < 2 ** (8 * array(typecode).itemsize):
+            return typecode
+
+
+def _rows(graph, sources):
+    """The distance and next hop rows for each source in SOURCES, as
+    arrays of doubles and of node ids"""
+    size = len(graph)
+    offsets = graph.offsets
+    targets = graph.targets
+    weights = graph.weights
+    inf = float('inf')
+    rows = []
+    for source in sources:
+        distance = array('d', [inf]) * size
+        previous = [-1] * size
+        settled = bytearray(size)
+        order = []
+        distance[source] = 0
+        heap = [(0, source)]
+        while heap:
+            node_distance, node = heappop(heap)
+            if settled[node]:
+                continue
+            settled[node] = 1
+            order.append(node)
+            for k in range(offsets[node], offsets[node + 1]):
+                dest = targets[k]
+                new_distance = node_distance + weights[k]
+                if new_distance < distance[dest]:
+                    distance[dest] = new_distance
+                    previous[dest] = node
+                    heappush(heap, (new_distance, dest))
+        # The first hop to a node is the first hop to the node before
+        # it, and nodes come out after the node before them
+        hops = array(_hop_typecode(size), [size]) * size
+        hops[source] = source
+        for node in order[1:]:
+            before = previous[node]
+            hops[node] = node if before == source else hops[before]
+        rows.append((source, distance, hops))
+    return rows
+
+
+def _worker_rows(sources):
+    return _rows(_starmap._worker_graph, sources)
+
+
+class RouteTable():
+    """The shortest routes between every pair of stars at one jumpdrive.
+
+    distances[i * N + j] is the length of the shortest route from star
+    i to star j, in single precision (inf if there is none), and
+    next_hops[i * N + j] is the star to jump to first from i to get to
+    j, or N if j can't be reached.  The next hops come from the double
+    precision traversals, so the routes are exact even though the
+    distances kept are rounded.  Stars are numbered in the starmap's
+    order.
+
+    Use build() to work one out.  Dijkstra from every star costs about
+    N * E log N, so a map with a few thousand stars takes minutes;
+    MAX_WORKERS spreads the stars over that many processes.
+    """
+    FORMAT_VERSION = 1
+
+    def __init__(self, names, distances, next_hops):
+        self.names = list(names)
+        self.ids = {name: i for i, name in enumerate(self.names)}
+        self.distances = distances
+        self.next_hops = next_hops
+
+    @classmethod
+    def build(cls, starmap, jumpdrive, max_workers=1, chunk_size=64):
+        graph = _starmap.build_jump_csr(starmap, jumpdrive)
+        size = len(graph)
+        distances = array('f', [0]) * (size * size)
+        next_hops = array(_hop_typecode(size), [0]) * (size * size)
+
+        def store(rows):
+            for source, distance, hops in rows:
+                distances[source * size:(source + 1) * size] = \
+                    array('f', distance)
+                next_hops[source * size:(source + 1) * size] = hops
+
+        chunks = [range(start, min(start + chunk_size, size))
+                  for start in range(0, size, chunk_size)]
+        if max_workers == 1:
+            for chunk in chunks:
+                store(_rows(graph, chunk))
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers,
+                                     initializer=_starmap._set_worker_graph,
+                                     initargs=(graph,)) as executor:
+                for rows in executor.map(_worker_rows, chunks):
+                    store(rows)
+        return cls(graph.names, distances, next_hops)
+
+    def __len__(self):
+        return len(self.names)
+
+    def _id(self, name):
+        if name not in self.ids:
+            raise IndexError("Unable to find {}".format(name))
+        return self.ids[name]
+
+    def distance(self, start, end):
+        """The length of the shortest route, inf if there is none"""
+        return self.distances[self._id(start) * len(self) + self._id(end)]
+
+    def route(self, start, end):
+        """The same list traverse_starmap(starmap, start, end, jumpdrive)
+        would return (or another route just as short, where there is a
+        tie), found by following the next hops"""
+        at = self._id(start)
+        if end not in self.ids:
+            return []
+        goal = self.ids[end]
+        size = len(self)
+        next_hops = self.next_hops
+        if next_hops[at * size + goal] == size:
+            return []
+        path = [self.names[at]]
+        while at != goal:
+            at = next_hops[at * size + goal]
+            path.append(self.names[at])
+        return path
+
+    def nbytes(self):
+        """The bytes taken by the two tables"""
+        return (len(self.distances) * self.distances.itemsize +
+                len(self.next_hops) * self.next_hops.itemsize)
+
+    def save(self, f):
+        """Writes the table to the file F"""
+        with open(f, "wb") as file:
+            pickle.dump(("route-table", self.FORMAT_VERSION, self.names,
+                         self.distances, self.next_hops), file,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, f):
+        """Reads a table written by save().  Only load files you trust,
+        since this unpickles them."""
+        with open(f, "rb") as file:
+            saved = pickle.load(file)
+        if (not isinstance(saved, tuple) or len(saved) != 5
+                or saved[0] != "route-table"):
+            raise ValueError("{} is not a saved route table".format(f))
+        if saved[1] != cls.FORMAT_VERSION:
+            raise ValueError("{} is version {}, expected version {}".format(
+                f, saved[1], cls.FORMAT_VERSION))
+        return cls(*saved[2:])
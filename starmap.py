@@ -1,8 +1,24 @@
 #!/usr/bin/env python3
 
 
-from graph import Graph
+from graph import Graph, CSRGraph, IndexedTraversalState, TraversalState
+from contraction import ContractionHierarchy
+import bz2
+import gzip
+import lzma
 import math
+import mmap
+import struct
+import sys
+import time
+from array import array
+from collections import OrderedDict, deque
+from collections.abc import Mapping, Sequence
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager, nullcontext
+from functools import partial
+from heapq import heappush, heappop
+from itertools import chain, count, product
 
 
 """ A starmap file is a WELL formed file consisting of lines.  Each
@@ -11,7 +27,7 @@ line has an X, Y, and Z coordinate and then the name of the star
 
 
 
-def load_starmap(f):
+def load_starmap(f, timings=None):
     """This will return a dictionary, where the key is the name of the
     star and the value is a 3-tuple for the X, Y, Z coordinate for the
     star.
@@ -23,17 +39,346 @@ def load_starmap(f):
     coordinates.
 
     The X, Y, and Z coordinates should be floating point values.
+
+    The time taken is recorded as the "load" phase of TIMINGS, a
+    PhaseTimings, if one is given.
+    """
+    with _phase(timings, "load"):
+        catalog = load_catalog(f)
+        return dict(catalog.items())
+
+
+class PhaseTimings():
+    """Wall clock time spent in each phase of starmap queries.
+
+    Pass one as the timings argument of load_starmap or
+    traverse_starmap and the seconds spent in each phase ("load",
+    "edge_build", "search" and "reconstruct", or "grid_build" instead
+    of "edge_build" for implicit queries) add up in self.phases.
+    CALLBACK, if given, is called as callback(phase, seconds) each
+    time a phase ends.
     """
-    dict = {}
-    file = open(f, "r")
-    for line in file:
-        line = line.strip().split()
-        dict[line[3]] = (float(line[0]), float(line[1]), float(line[2]))
-    file.close()
-    return dict
+    def __init__(self, callback=None):
+        self.phases = {}
+        self.callback = callback
+
+    @contextmanager
+    def phase(self, name):
+        reference = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - reference
+            self.phases[name] = self.phases.get(name, 0) + elapsed
+            if self.callback is not None:
+                self.callback(name, elapsed)
+
+
+def _phase(timings, name):
+    if timings is None:
+        return nullcontext()
+    return timings.phase(name)
+
+
+class StarCatalog(Mapping):
+    """A starmap packed into flat arrays.
+
+    The coordinates live in one contiguous array of doubles laid out
+    as N rows of X, Y, Z (so star i is coords[3*i:3*i+3]) next to a
+    list of the N names.  It reads like the dictionary load_starmap
+    returns, mapping names to 3-tuples, and can go anywhere a starmap
+    dictionary can.
+    """
+    def __init__(self, names, coords):
+        if len(coords) != 3 * len(names):
+            raise ValueError("Need 3 coordinates for each of {} stars".format(
+                len(names)))
+        self.names = names
+        self.coords = coords
+        self._index = None
+
+    @property
+    def index(self):
+        """The dictionary from name to index, built the first time it's
+        needed.  Later duplicates win, the same as filling in a
+        dictionary."""
+        if self._index is None:
+            self._index = {name: i for i, name in enumerate(self.names)}
+        return self._index
+
+    def point(self, i):
+        """The X, Y, Z coordinates of the star at index I"""
+        return tuple(self.coords[3 * i:3 * i + 3])
+
+    def __getitem__(self, name):
+        return self.point(self.index[name])
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+    def jump_edge_batches(self, jumpdrive, batch_size=65536):
+        """Iterates over lists of at most BATCH_SIZE (i, j, distance)
+        index triples, together covering every ordered pair of stars no
+        further apart than the jumpdrive distance.
+
+        The stars are bucketed into a grid of jumpdrive-sized cells and
+        distances are only worked out a block at a time between a cell
+        and its neighbors, so memory stays bounded by the grid plus one
+        batch no matter how many pairs are in range."""
+        if jumpdrive < 0:
+            return
+        cell_size = StarGrid.jump_cell_size(jumpdrive)
+        cells = {}
+        for i in self.index.values():
+            cells.setdefault(_cell(self.point(i), cell_size), []).append(i)
+        batch = []
+        for (cx, cy, cz), members in cells.items():
+            points = [(i, self.point(i)) for i in members]
+            for dx, dy, dz in product((-1, 0, 1), repeat=3):
+                others = cells.get((cx + dx, cy + dy, cz + dz))
+                if others is None:
+                    continue
+                other_points = [(j, self.point(j)) for j in others]
+                for i, p in points:
+                    for j, q in other_points:
+                        if i != j:
+                            distance = math.dist(p, q)
+                            if distance <= jumpdrive:
+                                batch.append((i, j, distance))
+                                if len(batch) == batch_size:
+                                    yield batch
+                                    batch = []
+        if batch:
+            yield batch
+
+
+def load_catalog(f, batch_size=65536):
+    """Reads a starmap file into a StarCatalog.
+
+    The file is streamed through iter_starmap, so it can be compressed
+    and its text is never held in memory all at once; each batch of
+    coordinates goes straight into the packed array."""
+    names = []
+    coords = array('d')
+    for batch in iter_starmap(f, batch_size):
+        for name, x, y, z in batch:
+            names.append(name)
+            coords.extend((x, y, z))
+    return StarCatalog(names, coords)
+
+
+def open_starmap(f):
+    """Opens a starmap file for reading as text.  Files compressed with
+    gzip, bz2 or xz are recognized by their first bytes and
+    decompressed on the fly."""
+    with open(f, "rb") as file:
+        magic = file.read(6)
+    for prefix, opener in ((b"\x1f\x8b", gzip.open), (b"BZh", bz2.open),
+                           (b"\xfd7zXZ\x00", lzma.open)):
+        if magic.startswith(prefix):
+            return opener(f, "rt")
+    return open(f, "r")
+
+
+def iter_starmap(f, batch_size=65536):
+    """Iterates over lists of at most BATCH_SIZE (name, x, y, z)
+    records from a starmap file, in file order.
+
+    Only one batch is held at a time, so this is the way to read
+    catalogs too big to load in one go.  Blank lines are skipped and
+    anything else that isn't three numbers and a name raises a
+    ValueError naming the file and line."""
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1")
+    batch = []
+    with open_starmap(f) as file:
+        for number, line in enumerate(file, 1):
+            fields = line.split()
+            if not fields:
+                continue
+            if len(fields) != 4:
+                raise ValueError("{}:{}: expected X Y Z NAME, got {!r}".format(
+                    f, number, line.strip()))
+            try:
+                batch.append((fields[3], float(fields[0]), float(fields[1]),
+                              float(fields[2])))
+            except ValueError:
+                raise ValueError("{}:{}: bad coordinates in {!r}".format(
+                    f, number, line.strip())) from None
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def stream_jump_graph(f, jumpdrive, batch_size=65536):
+    """Builds the jump graph straight from a starmap file.
 
+    Stars are read a batch at a time with iter_starmap and each one is
+    added to the graph and connected to the stars already read that
+    are in range, found through a StarGrid that grows along with the
+    graph.  Like load_starmap, a star appearing twice keeps its last
+    coordinates."""
+    graph = Graph()
+    if jumpdrive < 0:
+        for batch in iter_starmap(f, batch_size):
+            for name, x, y, z in batch:
+                graph[name] = (x, y, z)
+        return graph
+    grid = StarGrid.for_jumpdrive({}, jumpdrive)
+    for batch in iter_starmap(f, batch_size):
+        for name, x, y, z in batch:
+            coords = (x, y, z)
+            if name in graph:
+                del graph[name]
+                grid.remove(name)
+            graph[name] = coords
+            node = graph[name]
+            for other, distance in grid.within(coords, jumpdrive):
+                other_node = graph[other]
+                node.connect(other_node, distance)
+                other_node.connect(node, distance)
+            grid.add(name, coords)
+    return graph
 
-def traverse_starmap(starmap, start, end, jumpdrive):
+
+# The binary starmap format is a fixed header followed by sections
+# that are each padded out to a multiple of 8 bytes:
+#
+#   coords         N*3 float64, X Y Z rows
+#   offsets        N+1 int64    \
+#   targets        E   int32     | the jump graph in CSR form
+#   weights        E   float64   |
+#   back_offsets   N+1 int64     | and its reverse
+#   back_sources   E   int32     |
+#   back_edge_ids  E   int64    /
+#   name_offsets   N+1 int64, where each name starts in the name bytes
+#   name bytes     the names in UTF-8, back to back
+#
+# All in the byte order recorded in the header.
+STARMAP_MAGIC = b"STARMAP\0"
+STARMAP_VERSION = 1
+_HEADER = struct.Struct("<8sIIqqdq")
+_BYTEORDERS = ("little", "big")
+_SECTIONS = (("coords", 'd'), ("offsets", 'q'), ("targets", 'i'),
+             ("weights", 'd'), ("back_offsets", 'q'), ("back_sources", 'i'),
+             ("back_edge_ids", 'q'), ("name_offsets", 'q'))
+
+
+class _NameTable(Sequence):
+    """The names in a binary starmap, decoded one at a time as they are
+    looked at"""
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[k] for k in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("name index out of range")
+        return str(self.blob[self.offsets[i]:self.offsets[i + 1]], "utf-8")
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+
+def write_starmap_binary(path, starmap, jumpdrive):
+    """Saves a starmap and its jump graph for the given jumpdrive in the
+    binary format read by read_starmap_binary"""
+    if not isinstance(starmap, StarCatalog):
+        names = list(starmap)
+        coords = array('d')
+        for name in names:
+            coords.extend(starmap[name])
+        starmap = StarCatalog(names, coords)
+    graph = build_jump_csr(starmap, jumpdrive)
+    if len(graph) >= 2 ** 31:
+        raise ValueError("Too many stars for the binary format")
+    encoded = [str(name).encode("utf-8") for name in starmap.names]
+    name_offsets = array('q', [0])
+    for name in encoded:
+        name_offsets.append(name_offsets[-1] + len(name))
+    sections = {"coords": starmap.coords, "offsets": graph.offsets,
+                "targets": graph.targets, "weights": graph.weights,
+                "back_offsets": graph.back_offsets,
+                "back_sources": graph.back_sources,
+                "back_edge_ids": graph.back_edge_ids,
+                "name_offsets": name_offsets}
+    with open(path, "wb") as file:
+        file.write(_HEADER.pack(STARMAP_MAGIC, STARMAP_VERSION,
+                                _BYTEORDERS.index(sys.byteorder), len(graph),
+                                graph.edge_count(), jumpdrive,
+                                name_offsets[-1]))
+        for name, typecode in _SECTIONS:
+            data = sections[name]
+            if not (isinstance(data, array) and data.typecode == typecode):
+                data = array(typecode, data)
+            _write_padded(file, data.tobytes())
+        _write_padded(file, b"".join(encoded))
+
+
+def _write_padded(file, data):
+    file.write(data)
+    file.write(bytes(-len(data) % 8))
+
+
+def read_starmap_binary(path):
+    """Opens a file written by write_starmap_binary.
+
+    The file is memory mapped rather than read, so opening it costs the
+    same however big the catalog is, and every process that opens the
+    same file shares its pages.  Returns (catalog, graph, jumpdrive):
+    a StarCatalog and a CSRGraph whose arrays are views of the mapped
+    file, with graph node ids matching the catalog's star indices.
+    """
+    with open(path, "rb") as file:
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    if len(mapped) < _HEADER.size:
+        raise ValueError("{} is too short to be a binary starmap".format(path))
+    (magic, version, byteorder, nodes, edges, jumpdrive,
+     name_bytes) = _HEADER.unpack_from(mapped)
+    if magic != STARMAP_MAGIC:
+        raise ValueError("{} is not a binary starmap".format(path))
+    if version != STARMAP_VERSION:
+        raise ValueError("{} is version {}, expected version {}".format(
+            path, version, STARMAP_VERSION))
+    if byteorder >= len(_BYTEORDERS) or _BYTEORDERS[byteorder] != sys.byteorder:
+        raise ValueError("{} was written on a machine with a different "
+                         "byte order".format(path))
+    lengths = {"coords": 3 * nodes, "offsets": nodes + 1, "targets": edges,
+               "weights": edges, "back_offsets": nodes + 1,
+               "back_sources": edges, "back_edge_ids": edges,
+               "name_offsets": nodes + 1}
+    view = memoryview(mapped)
+    position = _HEADER.size
+    sections = {}
+    for name, typecode in _SECTIONS:
+        size = lengths[name] * array(typecode).itemsize
+        if position + size > len(mapped):
+            raise ValueError("{} is truncated".format(path))
+        sections[name] = view[position:position + size].cast(typecode)
+        position += size + (-size % 8)
+    if position + name_bytes > len(mapped):
+        raise ValueError("{} is truncated".format(path))
+    names = _NameTable(sections["name_offsets"],
+                       view[position:position + name_bytes])
+    catalog = StarCatalog(names, sections["coords"])
+    graph = CSRGraph(names, sections["offsets"], sections["targets"],
+                     sections["weights"],
+                     back=(sections["back_offsets"], sections["back_sources"],
+                           sections["back_edge_ids"]))
+    return catalog, graph, jumpdrive
+
+
+def traverse_starmap(starmap, start, end, jumpdrive, timings=None,
+                     implicit=False):
     """In this game you have a starship that can jump between stars
     located in a 3 dimensional space up to a given distance (the
     "jumpdrive" distance)...
@@ -58,59 +403,508 @@ def traverse_starmap(starmap, start, end, jumpdrive):
     It should return an empty array [] if there is no path which meets
     the constraint.
 
+    If TIMINGS (a PhaseTimings) is given, the time spent building the
+    graph, searching and rebuilding the path is added to it.
+
+    With IMPLICIT set no edges are built at all: an ImplicitJumpGraph
+    works out the jumps from each star as the search reaches it, so
+    the query takes memory in proportion to the stars it explores
+    rather than to the number of jumps, which suits big maps and long
+    jumpdrives.
     """
+    if implicit:
+        with _phase(timings, "grid_build"):
+            implicitGraph = ImplicitJumpGraph(starmap, jumpdrive,
+                                              cache_size=0)
+        return implicitGraph.route(start, end, timings)
 
-    myGraph = Graph(starmap)
-    
-    for star1 in myGraph:
-        # stars connected to star1
-        for star2 in myGraph:
-            # if they're not the same star
-            if star1 != star2:
-                distance = calcDistance(star1.data, star2.data)
-                
-                
-                # if distance between star1 and 2 is < jumpdrive
-                if distance <= jumpdrive:
-                    # connect star1 and star2, 
-                    
-                    myGraph.connect(star1.name, star2.name, distance)
-    # print(myGraph)
-    # return
-  
-    myPath = getPath(start, end, myGraph) 
-        
+    with _phase(timings, "edge_build"):
+        myGraph = build_jump_graph(starmap, jumpdrive)
+    if end not in myGraph:
+        return []
+
+    # Straight line distance never overestimates, so A* can use it
+    goal = starmap[end]
+    heuristic = lambda node: calcDistance(node.data, goal)
+    state = TraversalState()
+    with _phase(timings, "search"):
+        reached = myGraph.astar_search(start, end, heuristic, state,
+                                       path=False)
+    with _phase(timings, "reconstruct"):
+        myPath = []
+        if reached:
+            myPath = [node.name for node in state.path(myGraph[end])]
     return myPath
 
-def getPath(startNode, endName, graph):
-    #end is a string - find node with .name == end
-    hasEnd = False
-    curNode = None # will be last node from dijkstras, then go backwards from here
 
-    for node in graph.dijkstra_traversal(startNode):
-        if node.name == endName:
-            hasEnd = True
-            curNode = node
+class StarGrid():
+    """A uniform 3D grid over the stars in a starmap.
+
+    Space is cut into cubes CELL_SIZE on a side and every star is
+    hashed into the cube containing it.  Any star within CELL_SIZE of
+    a given point has to be in that point's cube or one of the 26
+    around it, so a range query only looks at those 27 cells instead
+    of the whole map.
+    """
+    def __init__(self, starmap, cell_size):
+        if cell_size <= 0:
+            raise ValueError("cell_size must be positive")
+        self.starmap = starmap
+        self.cell_size = cell_size
+        self.cells = {}
+        for name in starmap:
+            self.cells.setdefault(self.cell(starmap[name]), []).append(name)
+
+    @staticmethod
+    def jump_cell_size(jumpdrive):
+        """The cell size for finding jumps of up to JUMPDRIVE, which is
+        the jumpdrive itself.  Any positive cell size is correct, a
+        zero jumpdrive just can't be used as one."""
+        return jumpdrive if jumpdrive > 0 else 1.0
+
+    @classmethod
+    def for_jumpdrive(cls, starmap, jumpdrive):
+        """A grid for looking up the jumps of up to JUMPDRIVE"""
+        return cls(starmap, cls.jump_cell_size(jumpdrive))
+
+    def add(self, name, coords):
+        """Adds a star to the grid (and to its starmap)"""
+        self.starmap[name] = coords
+        self.cells.setdefault(self.cell(coords), []).append(name)
+
+    def remove(self, name):
+        """Removes a star from the grid (and from its starmap)"""
+        key = self.cell(self.starmap[name])
+        self.cells[key].remove(name)
+        if not self.cells[key]:
+            del self.cells[key]
+        del self.starmap[name]
+
+    def cell(self, coords):
+        """The key of the cell containing the coordinates"""
+        return _cell(coords, self.cell_size)
+
+    def nearby(self, coords):
+        """Iterates over the names of every star in the cells around
+        the coordinates, which is a superset of the stars within
+        cell_size of them"""
+        cx, cy, cz = self.cell(coords)
+        for dx, dy, dz in product((-1, 0, 1), repeat=3):
+            yield from self.cells.get((cx + dx, cy + dy, cz + dz), ())
+
+    def within(self, coords, radius):
+        """Iterates over (name, distance) for each star at most RADIUS
+        from the coordinates.  RADIUS can't be bigger than cell_size."""
+        assert radius <= self.cell_size
+        for name in self.nearby(coords):
+            distance = calcDistance(coords, self.starmap[name])
+            if distance <= radius:
+                yield name, distance
+
+
+def _cell(coords, cell_size):
+    return (math.floor(coords[0] / cell_size),
+            math.floor(coords[1] / cell_size),
+            math.floor(coords[2] / cell_size))
+
+
+def jump_edges(starmap, jumpdrive):
+    """Iterates over (star1, star2, distance) for every ordered pair of
+    different stars no further apart than the jumpdrive distance.
+
+    This only compares stars in neighboring grid cells, so it costs
+    about O(N*k) for k stars in range rather than O(N^2)."""
+    if jumpdrive < 0:
+        return
+    grid = StarGrid.for_jumpdrive(starmap, jumpdrive)
+    for star1 in starmap:
+        for star2, distance in grid.within(starmap[star1], jumpdrive):
+            if star1 != star2:
+                yield star1, star2, distance
+
+
+def build_jump_graph(starmap, jumpdrive):
+    """Creates a graph for all the stars with an edge for every jump
+    the jumpdrive can make"""
+    graph = Graph()
+    graph.add_nodes(starmap.items())
+    # Every pair comes out once, so there is nothing to validate
+    if isinstance(starmap, StarCatalog):
+        names = starmap.names
+        for batch in starmap.jump_edge_batches(jumpdrive):
+            graph.add_edges(((names[i], names[j], distance)
+                             for i, j, distance in batch), validate=False)
+        return graph
+    graph.add_edges(jump_edges(starmap, jumpdrive), validate=False)
+    return graph
+
+
+def build_jump_csr(starmap, jumpdrive):
+    """Like build_jump_graph but produces a frozen CSRGraph, with the
+    stars numbered in the starmap's order and their coordinates as the
+    node data"""
+    if isinstance(starmap, StarCatalog):
+        names = starmap.names
+        data = [starmap.point(i) for i in range(len(names))]
+        edges = chain.from_iterable(starmap.jump_edge_batches(jumpdrive))
+        return CSRGraph.from_edges(names, edges, data)
+    names = list(starmap)
+    ids = {name: i for i, name in enumerate(names)}
+    data = [starmap[name] for name in names]
+    edges = ((ids[star1], ids[star2], distance)
+             for star1, star2, distance in jump_edges(starmap, jumpdrive))
+    return CSRGraph.from_edges(names, edges, data)
+
+
+def _star_astar(starmap, start, end, neighbors):
+    """A* over star names from START to END, with the straight line
+    distance for the heuristic.  NEIGHBORS(star) gives the (star,
+    distance) pairs for the jumps from a star.  It settles stars and
+    breaks ties just as Graph.astar_search does on the built jump
+    graph.  Returns the dictionary of previous stars for the stars it
+    reached, which has END in it if there is a route."""
+    goal = starmap[end]
+    counter = count()
+    distance = {start: 0}
+    previous = {start: None}
+    settled = set()
+    heap = [(calcDistance(starmap[start], goal), next(counter), start)]
+    while heap:
+        _, _, star = heappop(heap)
+        if star in settled:
+            continue
+        settled.add(star)
+        if star == end:
+            return previous
+        star_distance = distance[star]
+        for dest, weight in neighbors(star):
+            if dest in settled:
+                continue
+            new_distance = star_distance + weight
+            if new_distance < distance.get(dest, float('inf')):
+                distance[dest] = new_distance
+                previous[dest] = star
+                heappush(heap, (new_distance +
+                                calcDistance(starmap[dest], goal),
+                                next(counter), dest))
+    previous.pop(end, None)
+    return previous
+
+
+def _walk_back(previous, end):
+    """The list of stars from the root of PREVIOUS, a dictionary of
+    previous stars, to END, or [] if END isn't in it"""
+    if end not in previous:
+        return []
+    path = [end]
+    while previous[path[-1]] is not None:
+        path.append(previous[path[-1]])
+    path.reverse()
+    return path
+
+
+class StarNavigator():
+    """Answers many route queries against one starmap and jumpdrive.
+
+    The jump graph is built once when the navigator is created.  Each
+    route query runs (or reuses) a full shortest path traversal from
+    the starting star and keeps the resulting shortest path tree, a
+    dictionary mapping each reachable star to the star before it.  The
+    CACHE_SIZE most recently used trees are kept, so another query from
+    the same star is just a walk back along the tree.
+
+    With HIERARCHY set to True a ContractionHierarchy of the jump graph
+    is built up front (or one saved earlier can be passed in) and routes
+    come from its small upward searches instead of full traversals.
+    """
+    def __init__(self, starmap, jumpdrive, cache_size=128, hierarchy=None):
+        if cache_size < 1:
+            raise ValueError("cache_size must be at least 1")
+        self.starmap = starmap
+        self.jumpdrive = jumpdrive
+        self.graph = build_jump_graph(starmap, jumpdrive)
+        self.cache_size = cache_size
+        self.trees = OrderedDict()
+        if hierarchy is True:
+            hierarchy = ContractionHierarchy(self.graph)
+        self.hierarchy = hierarchy or None
+
+    def tree(self, start):
+        """Returns the shortest path tree rooted at START"""
+        if start in self.trees:
+            self.trees.move_to_end(start)
+            return self.trees[start]
+        tree = {}
+        state = TraversalState()
+        for node in self.graph.dijkstra_traversal(start, state=state):
+            if node not in state.distance:
+                break
+            previous = state.previous[node]
+            tree[node.name] = previous.name if previous is not None else None
+        self.trees[start] = tree
+        if len(self.trees) > self.cache_size:
+            self.trees.popitem(last=False)
+        return tree
+
+    def route(self, start, end):
+        """The same list traverse_starmap(starmap, start, end, jumpdrive)
+        would return"""
+        if end not in self.graph:
+            return []
+        if not self.graph.connectivity().may_reach(start, end):
+            return []
+        if self.hierarchy is not None:
+            return self.hierarchy.path(start, end)
+        return _walk_back(self.tree(start), end)
+
+
+class ImplicitJumpGraph():
+    """The jump graph of a starmap without the edges.
+
+    Only a StarGrid of the stars is built up front.  The jumps from a
+    star, with calcDistance for weights, are found in the grid when a
+    search first needs them, so a route query takes memory in
+    proportion to the stars it explores rather than the number of
+    jumps, which grows as N*N in the worst case.
+
+    The neighbor lists of the CACHE_SIZE most recently expanded stars
+    are kept for later queries (0 keeps none).  The starmap must not
+    change while the graph is in use.
+    """
+    def __init__(self, starmap, jumpdrive, cache_size=1024):
+        if cache_size < 0:
+            raise ValueError("cache_size can't be negative")
+        self.starmap = starmap
+        self.jumpdrive = jumpdrive
+        self.grid = StarGrid.for_jumpdrive(starmap, jumpdrive)
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.cache_hits = 0
+        self.expanded = 0
+
+    def __contains__(self, name):
+        return name in self.starmap
+
+    def neighbors(self, name):
+        """The list of (star, distance) for every jump from star NAME"""
+        cache = self.cache
+        if name in cache:
+            self.cache_hits += 1
+            cache.move_to_end(name)
+            return cache[name]
+        self.expanded += 1
+        if self.jumpdrive < 0:
+            jumps = []
+        else:
+            jumps = [(star, distance) for star, distance in
+                     self.grid.within(self.starmap[name], self.jumpdrive)
+                     if star != name]
+        if self.cache_size:
+            cache[name] = jumps
+            if len(cache) > self.cache_size:
+                cache.popitem(last=False)
+        return jumps
+
+    def route(self, start, end, timings=None):
+        """The same list traverse_starmap(starmap, start, end, jumpdrive)
+        would return"""
+        if end not in self.starmap:
+            return []
+        if start not in self.starmap:
+            raise IndexError("Unable to find {}".format(start))
+        with _phase(timings, "search"):
+            previous = _star_astar(self.starmap, start, end, self.neighbors)
+        with _phase(timings, "reconstruct"):
+            return _walk_back(previous, end)
+
+
+def batch_routes(starmap, requests, jumpdrive, max_workers=None):
+    """Answers many route queries in parallel.
+
+    REQUESTS is an iterable of (start, end) pairs, or of bare star
+    names meaning routes from that star to every star it can reach.
+    The queries are grouped by starting star and each distinct start
+    gets one shortest path traversal in a process pool, so the work
+    spreads over the machine's cores.  The jump graph is built once as
+    a CSRGraph and handed to each worker process when it starts rather
+    than with every task.
+
+    This yields (start, routes) as each start finishes, in no
+    particular order, where routes maps each destination to the list
+    traverse_starmap would return for it.
+    """
+    sources = {}
+    for request in requests:
+        if isinstance(request, tuple):
+            start, end = request
+            ends = sources.setdefault(start, set())
+            if ends is not None:
+                ends.add(end)
+        else:
+            sources[request] = None
+    graph = build_jump_csr(starmap, jumpdrive)
+    for start in sources:
+        graph.id(start)
+    with ProcessPoolExecutor(max_workers=max_workers,
+                             initializer=_set_worker_graph,
+                             initargs=(graph,)) as executor:
+        futures = [executor.submit(_routes_from, start, ends)
+                   for start, ends in sources.items()]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+_worker_graph = None
+
+
+def _set_worker_graph(graph):
+    global _worker_graph
+    _worker_graph = graph
+
+
+def _routes_from(start, ends, graph=None):
+    """One single source traversal in a worker.  ENDS is a set of
+    destination names, or None for every reachable star.  GRAPH
+    defaults to the one the worker was started with.  Destinations not
+    in the graph get [], as traverse_starmap gives them."""
+    if graph is None:
+        graph = _worker_graph
+    state = IndexedTraversalState(len(graph))
+    routes = {}
+    if ends is not None:
+        for end in ends:
+            if end not in graph:
+                routes[end] = []
+        remaining = set(graph.id(end) for end in ends if end in graph)
+    for node in graph.dijkstra_traversal(start, state):
+        if state.distance[node] == float('inf'):
             break
-        
-    if hasEnd == False:
-        return [] 
-    path = []
-
-    while curNode.previous is not None:
-        path.append(curNode.name)
-        curNode = curNode.previous
-
-    if curNode.name == startNode: #when it reaches the start, add it
-        path.append(curNode.name)
-        return list(reversed(path))
+        if ends is not None:
+            remaining.discard(node)
+            if not remaining:
+                break
+    if ends is None:
+        targets = [i for i in range(len(graph))
+                   if state.distance[i] != float('inf')]
     else:
+        targets = [graph.id(end) for end in ends if end in graph]
+    for target in targets:
+        if state.distance[target] == float('inf'):
+            routes[graph.names[target]] = []
+        else:
+            routes[graph.names[target]] = [graph.names[i]
+                                           for i in state.path(target)]
+    return start, routes
+
+
+class JumpdriveSweep():
+    """Answers route queries for many jumpdrive distances at once.
+
+    The candidate jump edges are found once, at the largest jumpdrive
+    of interest, and each star's neighbors are kept sorted by distance.
+    A route at a shorter jumpdrive then only looks at the prefix of
+    each neighbor list that is in range, so nothing is rebuilt.
+    """
+    def __init__(self, starmap, max_jumpdrive):
+        self.starmap = starmap
+        self.max_jumpdrive = max_jumpdrive
+        self.edges = sorted(jump_edges(starmap, max_jumpdrive),
+                            key=lambda edge: edge[2])
+        self.neighbors = {name: [] for name in starmap}
+        for star1, star2, distance in self.edges:
+            self.neighbors[star1].append((distance, star2))
+        self._forest = None
+
+    def route(self, start, end, jumpdrive):
+        """The same list traverse_starmap(starmap, start, end, jumpdrive)
+        would return"""
+        if jumpdrive > self.max_jumpdrive:
+            raise ValueError("jumpdrive {} is beyond the sweep's {}".format(
+                jumpdrive, self.max_jumpdrive))
+        if end not in self.neighbors:
+            return []
+        if start not in self.neighbors:
+            raise IndexError("Unable to find {}".format(start))
+        previous = _star_astar(self.starmap, start, end,
+                               partial(self._jumps, jumpdrive=jumpdrive))
+        return _walk_back(previous, end)
+
+    def _jumps(self, star, jumpdrive):
+        """The (star, distance) pairs for the jumps from STAR in range
+        of JUMPDRIVE"""
+        for jump, other in self.neighbors[star]:
+            if jump > jumpdrive:
+                break
+            yield other, jump
+
+    def routes(self, start, end, jumpdrives):
+        """A list with the route for each of the jumpdrive distances"""
+        return [self.route(start, end, jumpdrive) for jumpdrive in jumpdrives]
+
+    def min_jumpdrive(self, start, end):
+        """The shortest jumpdrive that can get from start to end at all,
+        or None if even the sweep's maximum can't.
+
+        That is the longest jump on the path between them in a minimum
+        spanning forest of the jump graph, which is built the first
+        time this is asked with Kruskal's algorithm and a union-find."""
+        for name in (start, end):
+            if name not in self.neighbors:
+                raise IndexError("Unable to find {}".format(name))
+        if self._forest is None:
+            self._forest = self._spanning_forest()
+        # Walk the forest from start, remembering the longest jump on
+        # the way to each star
+        longest = {start: 0}
+        queue = deque([start])
+        while queue:
+            star = queue.popleft()
+            if star == end:
+                return longest[star]
+            for other, jump in self._forest[star]:
+                if other not in longest:
+                    longest[other] = max(longest[star], jump)
+                    queue.append(other)
+        return None
+
+    def _spanning_forest(self):
+        parent = {name: name for name in self.neighbors}
+
+        def find(name):
+            while parent[name] != name:
+                parent[name] = parent[parent[name]]
+                name = parent[name]
+            return name
+
+        forest = {name: [] for name in self.neighbors}
+        for star1, star2, distance in self.edges:
+            root1, root2 = find(star1), find(star2)
+            if root1 != root2:
+                parent[root1] = root2
+                forest[star1].append((star2, distance))
+                forest[star2].append((star1, distance))
+        return forest
+
+
+def getPath(startNode, endName, graph, heuristic=None):
+    """Finds the shortest path from startNode to endName.  If a
+    heuristic is given it uses an A* search on the graph, otherwise a
+    bidirectional dijkstra search.  If the graph already has an up to
+    date connectivity index, queries it rules out get [] without a
+    search."""
+    if endName not in graph:
         return []
+    for index in graph.connectivity_indexes.values():
+        if index.current() and not index.may_reach(startNode, endName):
+            return []
+    if heuristic is not None:
+        return graph.astar_search(startNode, endName, heuristic)
+    return graph.bidirectional_search(startNode, endName)
     
 
 def calcDistance(coords1, coords2):
     # calculates the distance between 2 3D coordinates
-    return math.sqrt((coords1[0] - coords2[0]) ** 2 + (coords1[1] - coords2[1]) ** 2 + (coords1[2] - coords2[2]) ** 2)
+    return math.dist(coords1, coords2)
 
 
 
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# Do not remove the above line, it is needed for testing
+
+import json
+import os
+import tempfile
+import unittest
+
+import benchmark
+
+
+class TestBenchmarkMethods(unittest.TestCase):
+    def test_suite(self):
+        report = benchmark.run_suite(sizes=(200,), repeat=1, queries=3,
+                                     log=None)
+        names = [row["benchmark"] for row in report["results"]]
+        self.assertEqual(list(benchmark.SUITE), names)
+        for row in report["results"]:
+            self.assertNotIn("error", row)
+            self.assertEqual(200, row["size"])
+        # The report has to survive a trip through JSON
+        self.assertEqual(report, json.loads(json.dumps(report)))
+        with self.assertRaises(ValueError):
+            benchmark.run_suite(sizes=(10,), only=["nothing"], log=None)
+        # A failing benchmark is recorded and the rest still run
+        def broken(fixture, repeat):
+            raise KeyError("missing")
+        benchmark.SUITE["broken"] = broken
+        try:
+            report = benchmark.run_suite(sizes=(20,), repeat=1, queries=1,
+                                         only=["broken", "bfs"], log=None)
+        finally:
+            del benchmark.SUITE["broken"]
+        self.assertEqual("KeyError: 'missing'",
+                         report["results"][0]["error"])
+        self.assertIn("seconds", report["results"][1])
+
+    def test_compare(self):
+        baseline = {"results": [
+            {"benchmark": "bfs", "size": 10, "seconds": 1.0},
+            {"benchmark": "memory", "size": 10, "bytes_per_node": 100,
+             "bytes_per_edge": 50},
+            {"benchmark": "dfs", "size": 10, "seconds": 1.0}]}
+        report = {"results": [
+            {"benchmark": "bfs", "size": 10, "seconds": 1.05},
+            {"benchmark": "memory", "size": 10, "bytes_per_node": 150,
+             "bytes_per_edge": 40},
+            {"benchmark": "dfs", "size": 10, "error": "RecursionError"},
+            {"benchmark": "dijkstra", "size": 10, "seconds": 1.0}]}
+        rows = benchmark.compare_results(report, baseline, tolerance=0.1)
+        self.assertEqual(
+            [("bfs", "seconds", False), ("memory", "bytes_per_node", True),
+             ("memory", "bytes_per_edge", False), ("dfs", "seconds", True)],
+            [(name, metric, regressed)
+             for name, _, metric, _, _, _, regressed in rows])
+
+    def test_main(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, "results.json")
+            argv = ["--sizes", "100", "--repeat", "1", "--only", "memory"]
+            self.assertEqual(0, benchmark.main(argv + ["--output", output]))
+            with open(output) as f:
+                saved = json.load(f)
+            # Nothing can get 100 times bigger, so comparing a rerun
+            # against it can't fail
+            self.assertEqual(0, benchmark.main(
+                argv + ["--baseline", output, "--tolerance", "100"]))
+            for row in saved["results"]:
+                row["bytes_per_node"] = 1
+            with open(output, "w") as f:
+                json.dump(saved, f)
+            self.assertEqual(1, benchmark.main(argv + ["--baseline", output]))
+            # Nor can a benchmark that now fails
+            for row in saved["results"]:
+                row["bytes_per_node"] = 1000
+            with open(output, "w") as f:
+                json.dump(saved, f)
+            def broken(fixture, repeat):
+                raise RuntimeError("broken")
+            memory = benchmark.SUITE["memory"]
+            benchmark.SUITE["memory"] = broken
+            try:
+                self.assertEqual(1, benchmark.main(
+                    argv + ["--baseline", output, "--tolerance", "100"]))
+            finally:
+                benchmark.SUITE["memory"] = memory
+
+
+"""Run the unit tests"""
+if __name__ == '__main__':
+    try:
+        unittest.main()
+    except SystemExit:
+        pass
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# Do not remove the above line, it is needed for testing
+
+import os
+import random
+import tempfile
+import unittest
+
+import starmap
+from contraction import ContractionHierarchy
+from graph import Graph, TraversalState
+
+
+def shortest_distances(g, source):
+    state = TraversalState()
+    for _ in g.dijkstra_traversal(source, state=state):
+        pass
+    return {node.name: d for node, d in state.distance.items()}
+
+
+class TestContractionMethods(unittest.TestCase):
+    def check_paths(self, g, hierarchy, sources):
+        for source in sources:
+            expected = shortest_distances(g, source)
+            for node in g:
+                path = hierarchy.path(source, node.name)
+                if node.name not in expected:
+                    self.assertEqual([], path)
+                    self.assertEqual(float('inf'),
+                                     hierarchy.distance(source, node.name))
+                    continue
+                self.assertEqual(source, path[0])
+                self.assertEqual(node.name, path[-1])
+                total = 0
+                for a, b in zip(path, path[1:]):
+                    total += g[a].edges[g[b]]
+                self.assertAlmostEqual(expected[node.name], total)
+                self.assertAlmostEqual(expected[node.name],
+                                       hierarchy.distance(source, node.name))
+
+    def test_random_graph(self):
+        rng = random.Random(3)
+        g = Graph()
+        for i in range(120):
+            g[i] = None
+        for i in range(120):
+            for _ in range(3):
+                dest = rng.randrange(120)
+                if dest != i and not g.connected(i, dest):
+                    g.connect(i, dest, rng.randint(1, 20))
+        hierarchy = ContractionHierarchy(g)
+        self.assertEqual(120, len(hierarchy))
+        self.check_paths(g, hierarchy, range(0, 120, 7))
+
+    def test_starmap(self):
+        s = starmap.load_starmap("starmap.txt")
+        for jumpdrive in (30, 60, 90):
+            g = starmap.build_jump_graph(s, jumpdrive)
+            hierarchy = ContractionHierarchy(g)
+            self.check_paths(g, hierarchy, ["Sol", "Sparta", "Kumasi"])
+        navigator = starmap.StarNavigator(s, 60, hierarchy=True)
+        self.assertEqual(["Sol", "Schrodinger", "Kumasi", "Sparta"],
+                         navigator.route("Sol", "Sparta"))
+        self.assertEqual([], starmap.StarNavigator(s, 0.1, hierarchy=True)
+                         .route("Sol", "Sparta"))
+
+    def test_save_load(self):
+        s = starmap.load_starmap("starmap.txt")
+        g = starmap.build_jump_graph(s, 60)
+        hierarchy = ContractionHierarchy(g)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "starmap.ch")
+            hierarchy.save(path)
+            loaded = ContractionHierarchy.load(path)
+            self.check_paths(g, loaded, ["Sol", "Altair"])
+            navigator = starmap.StarNavigator(s, 60, hierarchy=loaded)
+            self.assertEqual(["Sol", "Schrodinger", "Kumasi", "Sparta"],
+                             navigator.route("Sol", "Sparta"))
+            with open(path, "wb") as file:
+                file.write(b"not a hierarchy")
+            with self.assertRaises(Exception):
+                ContractionHierarchy.load(path)
+
+
+"""Run the unit tests"""
+if __name__ == '__main__':
+    try:
+        unittest.main()
+    except SystemExit:
+        pass
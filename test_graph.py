@@ -3,8 +3,13 @@
 
 import sys
 
-from graph import Graph
+from graph import Graph, TraversalState, CSRGraph, IndexedTraversalState
+from graph import DynamicShortestPathTree, TraversalStats, CompactGraphNode
+from graph import ConnectivityIndex, GraphSnapshot
+import gc
+import tracemalloc
 import random
+import threading
 import unittest
 import time
 
@@ -166,6 +171,633 @@ class TestGraphMethods(unittest.TestCase):
             else:
                 assert item.previous == solution_previous[item.name]
 
+    def test_heap_matches_scan(self):
+        g = Graph()
+        for i in range(60):
+            g[i] = "Node{}".format(i)
+        for i in range(60):
+            for _ in range(3):
+                dest = random.randrange(60)
+                if dest != i and not g.connected(i, dest):
+                    g.connect(i, dest, random.randint(1, 20))
+        scan = {}
+        for item in g.dijkstra_traversal(0, engine="scan"):
+            scan[item.name] = item.distance
+        last = 0
+        seen = []
+        for item in g.dijkstra_traversal(0):
+            self.assertEqual(scan[item.name], item.distance)
+            self.assertTrue(item.distance >= last)
+            last = item.distance
+            seen.append(item.name)
+            if item.previous is not None:
+                self.assertEqual(item.distance,
+                                 item.previous.distance +
+                                 item.previous.edges[item])
+        self.assertEqual(sorted(seen), list(range(60)))
+
+    def test_astar(self):
+        g = samplegraph()
+        solution_path = {0: [0], 1: [0, 1], 2: [0, 1, 4, 2], 3: [0, 1, 3],
+                         4: [0, 1, 4], 5: [0, 5]}
+        solution_weight = { 0:0, 1:1, 3:4, 4:5, 5:5, 2:9 }
+        for dest in solution_path:
+            state = TraversalState()
+            self.assertEqual(solution_path[dest],
+                             g.astar_search(0, dest, lambda node: 0, state))
+            self.assertEqual(solution_weight[dest], state.distance[g[dest]])
+        self.assertEqual([], g.astar_search(5, 0, lambda node: 0))
+        for node in g:
+            self.assertEqual("none-set", node.color)
+            self.assertEqual(float('inf'), node.distance)
+
+    def test_csr_shortest(self):
+        g = samplegraph()
+        csr = CSRGraph.from_graph(g)
+        self.assertEqual(len(g), len(csr))
+        self.assertEqual(8, csr.edge_count())
+        self.assertTrue(csr.connected(1, 4))
+        self.assertFalse(csr.connected(4, 1))
+        self.assertEqual([(1, 20), (4, 4)],
+                         [(csr.names[i], w) for i, w in csr.all_back_edges(csr.id(2))])
+        solution_weight = { 0:0, 1:1, 3:4, 4:5, 5:5, 2:9 }
+        solution_previous = {0:None, 1:0, 3:1, 4:1, 5:0, 2:4}
+        state = IndexedTraversalState(len(csr))
+        for item in csr.dijkstra_traversal(0, state):
+            name = csr.names[item]
+            self.assertEqual(solution_weight[name], state.distance[item])
+            if state.previous[item] == -1:
+                self.assertEqual(None, solution_previous[name])
+            else:
+                self.assertEqual(solution_previous[name],
+                                 csr.names[state.previous[item]])
+        self.assertEqual([0, 1, 4, 2],
+                         [csr.names[i] for i in state.path(csr.id(2))])
+
+    def test_csr_traversal_order(self):
+        for g in (make_star(), samplegraph()):
+            csr = CSRGraph.from_graph(g)
+            for traversal in ("bfs_traversal", "dfs_traversal",
+                              "dfs_iterative_traversal"):
+                expected = [n.name for n in getattr(g, traversal)(0)]
+                actual = [csr.names[i] for i in getattr(csr, traversal)(0)]
+                self.assertEqual(expected, actual)
+
+    def test_traversal_state(self):
+        g = samplegraph()
+        solution_weight = { 0:0, 1:1, 3:4, 4:5, 5:5, 2:9 }
+        first = TraversalState()
+        second = TraversalState()
+        # Two interleaved traversals from different starts
+        for a, b in zip(g.dijkstra_traversal(0, state=first),
+                        g.dijkstra_traversal(1, state=second)):
+            pass
+        for node in g:
+            self.assertEqual(solution_weight[node.name], first.distance[node])
+            self.assertEqual("none-set", node.color)
+        self.assertEqual(0, second.distance[g[1]])
+        self.assertEqual(10, second.distance[g[0]])
+        state = TraversalState()
+        order = [n.name for n in make_star().bfs_traversal(0, state=state)]
+        self.assertEqual(5, len(order))
+        self.assertEqual(order, [n.name for n in make_star().bfs_traversal(0)])
+
+    def test_concurrent_traversals(self):
+        g = Graph()
+        for i in range(300):
+            g[i] = "Node{}".format(i)
+        for i in range(300):
+            for _ in range(4):
+                dest = random.randrange(300)
+                if dest != i and not g.connected(i, dest):
+                    g.connect(i, dest, random.randint(1, 50))
+        expected = {}
+        for source in range(0, 300, 10):
+            state = TraversalState()
+            for _ in g.dijkstra_traversal(source, state=state):
+                pass
+            expected[source] = {n.name: d for n, d in state.distance.items()}
+        errors = []
+
+        def worker(seed):
+            rng = random.Random(seed)
+            for _ in range(20):
+                source = rng.choice(list(expected))
+                kind = rng.choice(["dijkstra", "bfs", "dfs"])
+                state = TraversalState()
+                if kind == "dijkstra":
+                    for _ in g.dijkstra_traversal(source, state=state):
+                        pass
+                    found = {n.name: d for n, d in state.distance.items()}
+                    if found != expected[source]:
+                        errors.append((source, kind))
+                else:
+                    traversal = (g.bfs_traversal if kind == "bfs"
+                                 else g.dfs_iterative_traversal)
+                    seen = set(n.name for n in traversal(source, state=state))
+                    if seen != set(expected[source]):
+                        errors.append((source, kind))
+
+        threads = [threading.Thread(target=worker, args=(i,))
+                   for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([], errors)
+
+    def test_dynamic_shortest_path_tree(self):
+        def check(g, tree):
+            state = TraversalState()
+            for _ in g.dijkstra_traversal(0, state=state):
+                pass
+            expected = {n.name: d for n, d in state.distance.items()}
+            self.assertEqual(expected, tree.distance)
+            for name in expected:
+                path = tree.path_to(name)
+                self.assertEqual(0, path[0])
+                total = 0
+                for a, b in zip(path, path[1:]):
+                    total += g[a].edges[g[b]]
+                self.assertEqual(expected[name], total)
+
+        rng = random.Random(4)
+        g = Graph()
+        for i in range(40):
+            g[i] = "Node{}".format(i)
+        tree = DynamicShortestPathTree(g, 0)
+        names = list(range(40))
+        next_name = 40
+        for step in range(400):
+            action = rng.random()
+            a, b = rng.choice(names), rng.choice(names)
+            if action < 0.55:
+                if a != b and not g.connected(a, b):
+                    g.connect(a, b, rng.randint(1, 10))
+            elif action < 0.85:
+                edges = [dest.name for dest, w in g[a].all_edges()]
+                if edges:
+                    g.disconnect(a, rng.choice(edges))
+            elif action < 0.95:
+                if a != 0:
+                    del g[a]
+                    names.remove(a)
+            else:
+                g[next_name] = "Node{}".format(next_name)
+                names.append(next_name)
+                next_name += 1
+            check(g, tree)
+        tree.close()
+        self.assertEqual([], g.listeners)
+        self.assertEqual([0, 1, 4, 2],
+                         DynamicShortestPathTree(samplegraph(), 0).path_to(2))
+        # Reweighting a tree edge through the unvalidated bulk path
+        g = Graph.from_edges([(0, 1, 1), (1, 2, 1)])
+        tree = DynamicShortestPathTree(g, 0)
+        g.add_edges([(0, 1, 10)], validate=False)
+        check(g, tree)
+        self.assertEqual(11, tree.distance_to(2))
+        g.add_edges([(0, 1, 3)], validate=False)
+        check(g, tree)
+        self.assertEqual(4, tree.distance_to(2))
+        self.assertEqual({g[1]: 3}, g[0].edges)
+        self.assertEqual({g[0]: 3}, g[1].back_edges)
+        tree.close()
+        # Removing a node and its child together
+        for lazy in (False, True):
+            g = Graph.from_edges([(0, 1, 1), (1, 2, 1), (2, 3, 1), (0, 3, 10)])
+            g.lazy_delete = lazy
+            tree = DynamicShortestPathTree(g, 0)
+            index = g.connectivity()
+            g.remove_nodes([1, 2])
+            # Listeners after the tree still heard about it
+            self.assertTrue(index.stale)
+            check(g, tree)
+            self.assertEqual([0, 3], tree.path_to(3))
+            self.assertEqual({0, 3}, set(tree.distance))
+            self.assertTrue(index.may_reach(0, 3))
+
+    def test_bidirectional_search(self):
+        g = samplegraph()
+        self.assertEqual([0, 1, 4, 2], g.bidirectional_search(0, 2))
+        self.assertEqual([3, 4, 2, 0, 5], g.bidirectional_search(3, 5))
+        self.assertEqual([], g.bidirectional_search(5, 0))
+        self.assertEqual([4], g.bidirectional_search(4, 4))
+        rng = random.Random(7)
+        g = Graph()
+        for i in range(80):
+            g[i] = "Node{}".format(i)
+        for i in range(80):
+            for _ in range(3):
+                dest = rng.randrange(80)
+                if dest != i and not g.connected(i, dest):
+                    g.connect(i, dest, rng.randint(1, 30))
+        state = TraversalState()
+        for _ in g.dijkstra_traversal(0, state=state):
+            pass
+        for dest in range(80):
+            path = g.bidirectional_search(0, dest)
+            if g[dest] not in state.distance:
+                self.assertEqual([], path)
+                continue
+            self.assertEqual(0, path[0])
+            self.assertEqual(dest, path[-1])
+            total = sum(g[a].edges[g[b]] for a, b in zip(path, path[1:]))
+            self.assertEqual(state.distance[g[dest]], total)
+        for node in g:
+            self.assertEqual("none-set", node.color)
+
+    def test_bulk_construction(self):
+        connections = [(0,1,1), (0,5,5),
+                       (1,2,20), (1,3,3), (1,4,4),
+                       (2,0,2), (3,4,4),
+                       (4,2,4)]
+        for validate in (True, False):
+            g = Graph()
+            g.add_nodes((i, "Node{}".format(i)) for i in range(6))
+            g.add_edges(connections, validate=validate)
+            self.assertEqual(repr(samplegraph()), repr(g))
+        g = Graph.from_edges(connections, nodes=[(5, "Node5")])
+        self.assertEqual(6, len(g))
+        self.assertEqual("Node5", g[5].data)
+        self.assertEqual(None, g[3].data)
+        self.assertEqual({g[1]: 20, g[4]: 4}, g[2].back_edges)
+        with self.assertRaises(Exception):
+            g.add_edges([(0, 1, 7)])
+        with self.assertRaises(IndexError):
+            g.add_edges([(0, 9, 7)])
+        self.assertEqual(1, g[0].edges[g[1]])
+
+    def test_stats(self):
+        g = samplegraph()
+        finished = []
+        g.stats = TraversalStats(callback=finished.append)
+        for _ in g.dijkstra_traversal(0):
+            pass
+        counts = finished[-1]
+        self.assertEqual("dijkstra", counts.kind)
+        self.assertEqual(6, counts.nodes_settled)
+        self.assertEqual(8, counts.edges_relaxed)
+        self.assertEqual(counts.heap_pushes, counts.heap_pops)
+        self.assertEqual(6, counts.distance_resets)
+        for _ in g.dijkstra_traversal(0, state=TraversalState()):
+            break
+        self.assertEqual(0, finished[-1].distance_resets)
+        self.assertEqual(1, finished[-1].nodes_settled)
+        g.bidirectional_search(0, 2)
+        g.astar_search(0, 2, lambda node: 0)
+        list(g.bfs_traversal(0))
+        self.assertEqual(["dijkstra", "dijkstra", "bidirectional", "astar", "bfs"],
+                         [counts.kind for counts in finished])
+        self.assertEqual(5, g.stats.traversals)
+        self.assertEqual(sum(c.nodes_settled for c in finished),
+                         g.stats.totals.nodes_settled)
+        g.stats = None
+        list(g.dfs_traversal(0))
+        self.assertEqual(5, len(finished))
+
+    def test_compact_nodes(self):
+        connections = [(0,1,1), (0,5,5),
+                       (1,2,20), (1,3,3), (1,4,4),
+                       (2,0,2), (3,4,4),
+                       (4,2,4)]
+        g = Graph(node_class=CompactGraphNode)
+        for i in range(6):
+            g[i] = "Node{}".format(i)
+        for connection in connections:
+            g.connect(*connection)
+        self.assertEqual(repr(samplegraph()), repr(g))
+        self.assertIsInstance(g[0], CompactGraphNode)
+        with self.assertRaises(AttributeError):
+            g[0].color = "white"
+        self.assertEqual([(g[1], 1), (g[5], 5)], list(g[0].all_edges()))
+        # Without a state the traversals still run, they just leave
+        # nothing on the nodes
+        self.assertEqual([0, 1, 5, 2, 3, 4],
+                         [n.name for n in g.bfs_traversal(0)])
+        self.assertEqual([n.name for n in samplegraph().dfs_traversal(0)],
+                         [n.name for n in g.dfs_traversal(0)])
+        state = TraversalState()
+        for _ in g.dijkstra_traversal(0, state=state):
+            pass
+        self.assertEqual(9, state.distance[g[2]])
+        self.assertEqual([0, 1, 4, 2], g.astar_search(0, 2, lambda node: 0))
+        self.assertEqual([0, 1, 4, 2], g.bidirectional_search(0, 2))
+        g.disconnect(1, 4)
+        del g[3]
+        self.assertEqual({g[0]: 2}, g[2].edges)
+        self.assertEqual({g[0]: 1}, g[1].back_edges)
+        compact = Graph.from_edges(connections, node_class=CompactGraphNode)
+        self.assertIsInstance(compact[5], CompactGraphNode)
+
+    def test_remove_nodes(self):
+        rng = random.Random(3)
+        edges = {(rng.randrange(60), rng.randrange(60)): rng.uniform(1, 9)
+                 for _ in range(600)}
+        edges = [(s, d, w) for (s, d), w in edges.items() if s != d]
+        # A hub joined both ways to everything
+        edges += [(60, i, 1) for i in range(60)]
+        edges += [(i, 60, 1) for i in range(60)]
+        doomed = [60] + list(range(0, 60, 3))
+        expected = Graph.from_edges(edges, nodes=[(i, None) for i in range(61)])
+        for name in doomed:
+            del expected[name]
+        g = Graph.from_edges(edges, nodes=[(i, None) for i in range(61)])
+        deleted = []
+        g.subscribe(lambda event, name: deleted.append(name))
+        with self.assertRaises(IndexError):
+            g.remove_nodes([1, 99])
+        self.assertEqual(61, len(g))
+        g.remove_nodes(doomed)
+        self.assertEqual(doomed, deleted)
+        self.assertEqual(repr(expected), repr(g))
+        self.assertTrue(g.check_structure())
+        for node in g:
+            for dest in node.edges:
+                self.assertIs(g[dest.name], dest)
+                self.assertEqual(node.edges[dest], dest.back_edges[node])
+
+    def test_lazy_delete(self):
+        g = samplegraph()
+        g.lazy_delete = True
+        g.compact_ratio = 10
+        hidden = g[4]
+        del g[4]
+        self.assertNotIn(4, g)
+        self.assertEqual(5, len(g))
+        # The edges are still there but nothing walks onto node 4
+        self.assertIn(hidden, g[1].edges)
+        self.assertEqual(1, len(g.tombstones))
+        self.assertEqual([0, 1, 5, 2, 3],
+                         [n.name for n in g.bfs_traversal(0)])
+        self.assertEqual([0, 1, 3, 5, 2],
+                         [n.name for n in g.dijkstra_traversal(0)])
+        self.assertEqual(21, g[2].distance)
+        self.assertEqual([0, 1, 2], g.astar_search(0, 2, lambda node: 0))
+        self.assertEqual([0, 1, 2], g.bidirectional_search(0, 2))
+        self.assertEqual([2, 3, 1, 5, 0],
+                         [n.name for n in g.dfs_traversal(0)])
+        self.assertEqual(5, len(list(g.dfs_iterative_traversal(0))))
+        # A new node can take the old one's name
+        g[4] = "new"
+        g.connect(1, 4, 1)
+        g.connect(4, 2, 1)
+        self.assertEqual([0, 1, 4, 2], g.bidirectional_search(0, 2))
+        g.compact()
+        self.assertEqual(set(), g.tombstones)
+        self.assertEqual({g[1]: 1}, g[4].back_edges)
+        self.assertEqual({}, g[3].edges)
+        self.assertEqual({g[2]: 20, g[3]: 3, g[4]: 1}, g[1].edges)
+        self.assertEqual({}, hidden.back_edges)
+        # Past the ratio deletes compact by themselves
+        g.compact_ratio = 0.1
+        g.remove_nodes([5])
+        self.assertEqual(set(), g.tombstones)
+        self.assertEqual({g[1]: 1}, g[0].edges)
+
+
+    def test_connectivity(self):
+        g = Graph()
+        for i in range(6):
+            g[i] = None
+        for source, dest in ((0, 1), (1, 2), (3, 4)):
+            g.connect(source, dest)
+            g.connect(dest, source)
+        index = g.connectivity()
+        self.assertIs(index, g.connectivity())
+        self.assertTrue(index.may_reach(0, 2))
+        self.assertFalse(index.may_reach(0, 3))
+        self.assertFalse(index.may_reach(5, 4))
+        self.assertTrue(index.same_component(3, 4))
+        with self.assertRaises(IndexError):
+            index.may_reach(0, 9)
+        # New nodes and edges are merged in without a rebuild
+        g[6] = None
+        g.connect(2, 3)
+        g.add_edges([(6, 5, 1)])
+        self.assertTrue(index.may_reach(0, 4))
+        self.assertTrue(index.may_reach(5, 6))
+        self.assertEqual(1, index.rebuilds)
+        g.disconnect(2, 3)
+        self.assertFalse(index.may_reach(0, 4))
+        del g[1]
+        self.assertFalse(index.may_reach(0, 2))
+        self.assertEqual(3, index.rebuilds)
+        index.close()
+        # A closed index isn't handed out any more
+        g.connect(0, 2)
+        self.assertIsNot(index, g.connectivity())
+        self.assertTrue(g.connectivity().may_reach(0, 2))
+
+    def test_strong_connectivity(self):
+        g = samplegraph()
+        index = ConnectivityIndex(g, directed=True)
+        self.assertTrue(index.may_reach(0, 5))
+        self.assertFalse(index.may_reach(5, 0))
+        self.assertTrue(index.same_component(0, 4))
+        self.assertFalse(index.same_component(0, 5))
+        self.assertEqual({0, 1, 2, 3, 4},
+                         {n.name for n in g
+                          if index.component(n.name) == index.component(0)})
+        # An edge along the existing order leaves the components alone,
+        # one against it merges them
+        g[6] = None
+        g.connect(5, 6)
+        self.assertFalse(index.may_reach(6, 5))
+        self.assertTrue(index.may_reach(0, 6))
+        self.assertFalse(index.strong_stale)
+        g.connect(5, 0)
+        self.assertTrue(index.strong_stale)
+        self.assertTrue(index.same_component(5, 0))
+        self.assertTrue(index.may_reach(5, 3))
+        # A long chain can't blow the stack
+        chain = Graph.from_edges((i, i + 1, 1) for i in range(50000))
+        chain.connect(50000, 0)
+        self.assertTrue(chain.connectivity(directed=True).same_component(
+            0, 40000))
+
+    def test_depth_first(self):
+        # Every node reachable and a long way down
+        chain = Graph.from_edges((i, i + 1, 1) for i in range(100000))
+        self.assertEqual(list(range(100000, -1, -1)),
+                         [n.name for n in chain.dfs_traversal(0)])
+        self.assertEqual(100001, len(list(chain.dfs_iterative_traversal(0))))
+        # The orders the recursive and the rescanning versions gave
+        g = samplegraph()
+        self.assertEqual([2, 4, 3, 1, 5, 0],
+                         [n.name for n in g.dfs_traversal(0)])
+        self.assertEqual([5, 4, 3, 2, 1, 0],
+                         [n.name for n in g.dfs_iterative_traversal(0)])
+        events = []
+        for node in g.dfs_traversal(
+                0, state=TraversalState(),
+                pre=lambda node: events.append(("pre", node.name)),
+                post=lambda node: events.append(("post", node.name))):
+            events.append(("yield", node.name))
+        self.assertEqual([("pre", 0), ("pre", 1), ("pre", 2), ("post", 2),
+                          ("yield", 2)], events[:5])
+        self.assertEqual(6, sum(1 for event in events if event[0] == "pre"))
+        self.assertEqual([name for event, name in events if event == "post"],
+                         [name for event, name in events if event == "yield"])
+        # A hub scanned once, not once per neighbor it finishes
+        hub = Graph.from_edges((0, i, 1) for i in range(1, 5000))
+        hub.stats = TraversalStats()
+        list(hub.dfs_iterative_traversal(0))
+        self.assertEqual(4999, hub.stats.totals.edges_relaxed)
+
+    def test_strongly_connected_components(self):
+        g = samplegraph()
+        components = g.strongly_connected_components()
+        self.assertEqual([[5], [0, 1, 2, 3, 4]],
+                         [sorted(component) for component in components])
+        g.connect(5, 0, 1)
+        self.assertEqual([[0, 1, 2, 3, 4, 5]],
+                         [sorted(c) for c in g.strongly_connected_components()])
+        # Two long cycles joined one way
+        big = Graph.from_edges([(i, (i + 1) % 50000, 1) for i in range(50000)] +
+                               [(50000 + i, 50000 + (i + 1) % 50000, 1)
+                                for i in range(50000)])
+        big.connect(0, 50000)
+        components = big.strongly_connected_components()
+        self.assertEqual([set(range(50000, 100000)), set(range(50000))],
+                         [set(component) for component in components])
+
+    def test_topological_sort(self):
+        g = samplegraph()
+        with self.assertRaises(ValueError):
+            g.topological_sort()
+        g.disconnect(2, 0)
+        order = g.topological_sort()
+        self.assertEqual(sorted(order), list(range(6)))
+        for node in g:
+            for dest in node.edges:
+                self.assertLess(order.index(node.name), order.index(dest.name))
+        g.connect(3, 3)
+        with self.assertRaises(ValueError):
+            g.topological_sort()
+        chain = Graph.from_edges((i + 1, i, 1) for i in range(100000))
+        self.assertEqual(list(range(100000, -1, -1)), chain.topological_sort())
+
+    def test_snapshot(self):
+        g = samplegraph()
+        before = [node.name for node in g.dfs_traversal(0)]
+        snap = g.snapshot()
+        self.assertIsInstance(snap, GraphSnapshot)
+        self.assertEqual(g.version, snap.version)
+        g[0] = "Changed"
+        g[6] = "Node6"
+        g.connect(5, 6, 1)
+        g.connect(5, 0, 2)
+        g.disconnect(1, 3)
+        del g[4]
+        self.assertEqual("Changed", g[0].data)
+        self.assertEqual("Node0", snap[0].data)
+        self.assertNotIn(6, snap)
+        self.assertIn(4, snap)
+        self.assertEqual(sorted(range(6)), sorted(snap.nodes))
+        self.assertEqual(6, len(snap.nodes))
+        self.assertTrue(snap.connected(1, 3))
+        self.assertTrue(snap.connected(3, 4))
+        self.assertFalse(snap.connected(5, 0))
+        self.assertEqual({}, snap[5].edges)
+        self.assertEqual(before,
+                         [node.name for node in snap.dfs_traversal(0)])
+        state = TraversalState()
+        list(snap.dijkstra_traversal(0, state=state))
+        self.assertEqual(9, state.distance[snap[2]])
+        # The graph moved on
+        self.assertFalse(g.connected(1, 3))
+        self.assertTrue(g.connected(5, 6))
+        self.assertNotIn(4, g)
+        g.check_structure()
+        # A later snapshot sees the later version, the earlier one doesn't
+        later = g.snapshot()
+        del g[6]
+        self.assertTrue(later.connected(5, 6))
+        self.assertNotIn(6, snap)
+        self.assertEqual(sorted(range(6)), sorted(snap.nodes))
+        # Snapshots are read-only
+        with self.assertRaises(TypeError):
+            snap[7] = "Node7"
+        with self.assertRaises(TypeError):
+            snap.connect(0, 1)
+        with self.assertRaises(TypeError):
+            del snap[0]
+        with self.assertRaises(TypeError):
+            snap[0].disconnect(snap[1])
+        # Snapshots go as soon as the readers drop them, without
+        # waiting for the garbage collector, and then nodes nobody holds
+        # an old version of aren't copied
+        node = g[2]
+        edges = node.edges
+        view = snap[1]
+        gc.disable()
+        try:
+            del snap, later, state
+            self.assertEqual(0, len(g.snapshots))
+        finally:
+            gc.enable()
+        g.connect(2, 3, 1)
+        self.assertIs(edges, node.edges)
+        with self.assertRaises(ReferenceError):
+            view.edges
+        # Reading a snapshot doesn't copy the edges
+        big = Graph.from_edges((i, (i * 7 + k) % 5000, 1)
+                               for i in range(5000) for k in range(1, 6))
+        snap = big.snapshot()
+        tracemalloc.start()
+        try:
+            self.assertEqual(5000, sum(1 for _ in snap.bfs_traversal(
+                0, state=TraversalState())))
+            kept = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        # Just the SnapshotNodes standing in for the nodes
+        self.assertLess(kept, 250 * 5000)
+
+    def test_snapshot_lazy_delete(self):
+        g = Graph.from_edges((i, i + 1, 1) for i in range(10))
+        g.lazy_delete = True
+        g.compact_ratio = 1
+        g.remove_nodes([3])
+        snap = g.snapshot()
+        g.remove_nodes([5, 6])
+        g.compact()
+        g[3] = "back"
+        self.assertNotIn(3, snap)
+        self.assertEqual({}, snap[2].edges)
+        self.assertEqual([snap[6]], list(snap[5].edges))
+        self.assertEqual(list(range(4, 11)),
+                         [node.name for node in snap.bfs_traversal(4)])
+        self.assertEqual([4], [node.name for node in g.bfs_traversal(4)])
+        csr = CSRGraph.from_graph(snap)
+        self.assertEqual(10, len(csr))
+
+    def test_snapshot_readers(self):
+        g = Graph.from_edges((i, (i + 1) % 200, 1) for i in range(200))
+        errors = []
+        done = threading.Event()
+
+        def reader(snap):
+            while not done.is_set():
+                names = [node.name for node in snap.dfs_traversal(0)]
+                if names != expected:
+                    errors.append(names)
+
+        snap = g.snapshot()
+        expected = [node.name for node in snap.dfs_traversal(0)]
+        threads = [threading.Thread(target=reader, args=(snap,))
+                   for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for i in range(0, 200, 2):
+            g.disconnect(i, i + 1)
+            g.connect(i, (i + 2) % 200, 1)
+        done.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([], errors)
+
 
 """Run the unit tests"""
 if __name__ == '__main__':
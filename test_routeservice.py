@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# Do not remove the above line, it is needed for testing
+
+import asyncio
+import random
+import unittest
+
+import starmap
+from routeservice import RouteService, RouteServiceBusy
+
+
+class TestRouteServiceMethods(unittest.TestCase):
+    def test_routes(self):
+        s = starmap.load_starmap("starmap.txt")
+        stars = list(s)
+        random.shuffle(stars)
+        pairs = [(star1, star2) for star1 in stars[:3] for star2 in stars[:6]]
+
+        async def run():
+            async with RouteService(s) as service:
+                paths = await asyncio.gather(
+                    *(service.route(star1, star2, 60)
+                      for star1, star2 in pairs))
+                self.assertEqual([], await service.route("Sol", "Nowhere", 60))
+                with self.assertRaises(IndexError):
+                    await service.route("Nowhere", "Sol", 60)
+                return paths, service
+        paths, service = asyncio.run(run())
+        for (star1, star2), path in zip(pairs, paths):
+            self.assertEqual(starmap.traverse_starmap(s, star1, star2, 60),
+                             path)
+        # One traversal per start, and none for the missing stars
+        self.assertEqual(3, service.traversals)
+        self.assertEqual(1, len(service.graphs))
+
+    def test_coalesce(self):
+        s = starmap.load_starmap("starmap.txt")
+
+        async def run():
+            service = RouteService(s)
+            try:
+                paths = await asyncio.gather(
+                    *(service.route("Sol", "Sparta", 60) for _ in range(5)),
+                    service.route("Sol", "Sparta", 300))
+            finally:
+                service.close()
+            return paths, service
+        paths, service = asyncio.run(run())
+        self.assertEqual(5 * [["Sol", "Schrodinger", "Kumasi", "Sparta"]] +
+                         [["Sol", "Sparta"]], paths)
+        self.assertEqual(2, service.queries)
+        self.assertEqual(4, service.coalesced)
+        self.assertEqual(2, len(service.graphs))
+        self.assertEqual({}, service.in_flight)
+
+    def test_backpressure(self):
+        s = starmap.load_starmap("starmap.txt")
+
+        async def run():
+            service = RouteService(s, max_pending=1, max_waiting=1)
+            try:
+                first = asyncio.ensure_future(service.route("Sol", "Sparta", 60))
+                second = asyncio.ensure_future(service.route("Sol", "Kumasi", 60))
+                await asyncio.sleep(0)
+                with self.assertRaises(RouteServiceBusy):
+                    await service.route("Sol", "Schrodinger", 60)
+                # The same query as one in flight is never turned away
+                third = await service.route("Sol", "Sparta", 60)
+                self.assertEqual(third, await first)
+                self.assertEqual(["Sol", "Schrodinger", "Kumasi"],
+                                 await second)
+                self.assertEqual(["Sol", "Schrodinger"],
+                                 await service.route("Sol", "Schrodinger", 60))
+            finally:
+                service.close()
+            return service
+        service = asyncio.run(run())
+        self.assertEqual(1, service.rejected)
+        self.assertEqual(0, service.queued)
+
+    def test_graph_cache(self):
+        s = starmap.load_starmap("starmap.txt")
+        jumpdrives = [20, 60, 300, 60, 25, 30]
+
+        async def run():
+            async with RouteService(s, max_graphs=2) as service:
+                paths = await asyncio.gather(
+                    *(service.route("Sol", "Sparta", jumpdrive)
+                      for jumpdrive in jumpdrives))
+                self.assertLessEqual(len(service.graphs), 2)
+                for jumpdrive in jumpdrives:
+                    await service.route("Sol", "Sparta", jumpdrive)
+                    self.assertLessEqual(len(service.graphs), 2)
+                self.assertEqual([25, 30], list(service.graphs))
+                return paths
+        paths = asyncio.run(run())
+        for jumpdrive, path in zip(jumpdrives, paths):
+            self.assertEqual(starmap.traverse_starmap(s, "Sol", "Sparta",
+                                                      jumpdrive), path)
+        with self.assertRaises(ValueError):
+            RouteService(s, max_graphs=0)
+
+
+"""Run the unit tests"""
+if __name__ == '__main__':
+    try:
+        unittest.main()
+    except SystemExit:
+        pass
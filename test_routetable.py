@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# Do not remove the above line, it is needed for testing
+
+import os
+import random
+import tempfile
+import unittest
+
+import starmap
+from routetable import RouteTable
+
+
+class TestRouteTableMethods(unittest.TestCase):
+    def test_routes(self):
+        s = starmap.load_starmap("starmap.txt")
+        for jumpdrive in (20, 60, 300):
+            table = RouteTable.build(s, jumpdrive)
+            navigator = starmap.StarNavigator(s, jumpdrive)
+            self.assertEqual(len(s), len(table))
+            for star1 in random.sample(list(s), 10):
+                for star2 in s:
+                    expected = navigator.route(star1, star2)
+                    self.assertEqual(expected, table.route(star1, star2))
+                    if expected:
+                        length = sum(starmap.calcDistance(s[a], s[b])
+                                     for a, b in zip(expected, expected[1:]))
+                        self.assertAlmostEqual(
+                            length, table.distance(star1, star2), places=3)
+                    else:
+                        self.assertEqual(float('inf'),
+                                         table.distance(star1, star2))
+        self.assertEqual(starmap.traverse_starmap(s, "Sol", "Sparta", 300),
+                         table.route("Sol", "Sparta"))
+        self.assertEqual([], table.route("Sol", "Nowhere"))
+        with self.assertRaises(IndexError):
+            table.route("Nowhere", "Sol")
+        # Under 256 stars the next hops fit in a byte
+        self.assertEqual(1, table.next_hops.itemsize)
+        self.assertEqual(4, table.distances.itemsize)
+        self.assertEqual(5 * len(s) ** 2, table.nbytes())
+
+    def test_workers(self):
+        s = starmap.load_starmap("starmap.txt")
+        table = RouteTable.build(s, 60)
+        parallel = RouteTable.build(s, 60, max_workers=2, chunk_size=10)
+        self.assertEqual(table.distances, parallel.distances)
+        self.assertEqual(table.next_hops, parallel.next_hops)
+
+    def test_save_load(self):
+        s = starmap.load_starmap("starmap.txt")
+        table = RouteTable.build(s, 60)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "table.bin")
+            table.save(path)
+            loaded = RouteTable.load(path)
+            self.assertEqual(table.names, loaded.names)
+            self.assertEqual(table.next_hops, loaded.next_hops)
+            self.assertEqual(["Sol", "Schrodinger", "Kumasi", "Sparta"],
+                             loaded.route("Sol", "Sparta"))
+            with open(path, "wb") as file:
+                file.write(b"not a table")
+            with self.assertRaises(Exception):
+                RouteTable.load(path)
+
+
+"""Run the unit tests"""
+if __name__ == '__main__':
+    try:
+        unittest.main()
+    except SystemExit:
+        pass
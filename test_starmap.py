@@ -1,9 +1,17 @@
 #!/usr/bin/env python3
 # Do not remove the above line, it is needed for testing
 
+import bz2
+import gzip
+import lzma
+import os
 import sys
+import tempfile
+import tracemalloc
+from array import array
 
 import starmap
+from graph import IndexedTraversalState
 import random
 import unittest
 import time
@@ -51,6 +59,279 @@ class TestStarmapMethods(unittest.TestCase):
         for star1 in starlist1[:3]:
             for star2 in starlist2[:5]:
                 test_internal(star1, star2)
+    def test_jump_edges(self):
+        s = starmap.load_starmap("starmap.txt")
+        for jumpdrive in (0, 0.1, 15, 60, 300):
+            brute = set()
+            for star1 in s:
+                for star2 in s:
+                    if star1 != star2:
+                        distance = starmap.calcDistance(s[star1], s[star2])
+                        if distance <= jumpdrive:
+                            brute.add((star1, star2, distance))
+            self.assertEqual(brute, set(starmap.jump_edges(s, jumpdrive)))
+
+    def test_navigator(self):
+        s = starmap.load_starmap("starmap.txt")
+        navigator = starmap.StarNavigator(s, 60, cache_size=2)
+        self.assertEqual(["Sol", "Schrodinger", "Kumasi", "Sparta"],
+                         navigator.route("Sol", "Sparta"))
+        self.assertEqual(["Sol"], navigator.route("Sol", "Sol"))
+        stars = list(s)
+        random.shuffle(stars)
+        for star1 in stars[:4]:
+            for star2 in stars[:6]:
+                self.assertEqual(starmap.traverse_starmap(s, star1, star2, 60),
+                                 navigator.route(star1, star2))
+        self.assertEqual(2, len(navigator.trees))
+        self.assertEqual([], starmap.StarNavigator(s, 0.1).route("Sol", "Sparta"))
+        self.assertEqual([], navigator.route("Sol", "Nowhere"))
+        with self.assertRaises(IndexError):
+            navigator.route("Nowhere", "Sol")
+
+    def test_catalog(self):
+        catalog = starmap.load_catalog("starmap.txt")
+        s = starmap.load_starmap("starmap.txt")
+        self.assertEqual(len(s), len(catalog))
+        self.assertEqual(3 * len(s), len(catalog.coords))
+        for star in s:
+            self.assertEqual(s[star], catalog[star])
+        for jumpdrive in (0, 15, 60):
+            edges = set()
+            for batch in catalog.jump_edge_batches(jumpdrive, batch_size=50):
+                self.assertTrue(len(batch) <= 50)
+                for i, j, distance in batch:
+                    edges.add((catalog.names[i], catalog.names[j], distance))
+            self.assertEqual(set(starmap.jump_edges(s, jumpdrive)), edges)
+        # A crowded cell still only holds one batch at a time
+        rng = random.Random(1)
+        crowded = starmap.StarCatalog(
+            ["S{}".format(i) for i in range(1000)],
+            array("d", (rng.uniform(0, 10) for _ in range(3000))))
+        batches = crowded.jump_edge_batches(100, batch_size=1000)
+        tracemalloc.start()
+        try:
+            self.assertEqual(1000, len(next(batches)))
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertLess(peak, 1000000)
+        self.assertEqual(999000, sum(len(batch) for batch in batches) + 1000)
+        graph = starmap.build_jump_graph(catalog, 60)
+        self.assertEqual(["Sol", "Schrodinger", "Kumasi", "Sparta"],
+                         starmap.getPath("Sol", "Sparta", graph))
+        self.assertEqual(["Sol", "Schrodinger", "Kumasi", "Sparta"],
+                         starmap.traverse_starmap(catalog, "Sol", "Sparta", 60))
+
+    def test_jump_csr(self):
+        s = starmap.load_starmap("starmap.txt")
+        for source in (s, starmap.load_catalog("starmap.txt")):
+            csr = starmap.build_jump_csr(source, 60)
+            graph = starmap.build_jump_graph(s, 60)
+            self.assertEqual(sum(len(n.edges) for n in graph), csr.edge_count())
+            distances = {}
+            for node in graph.dijkstra_traversal("Sol"):
+                distances[node.name] = node.distance
+            state = IndexedTraversalState(len(csr))
+            for i in csr.dijkstra_traversal("Sol", state):
+                self.assertAlmostEqual(distances[csr.names[i]], state.distance[i])
+            self.assertEqual(["Sol", "Schrodinger", "Kumasi", "Sparta"],
+                             [csr.names[i] for i in state.path(csr.id("Sparta"))])
+
+    def test_batch_routes(self):
+        s = starmap.load_starmap("starmap.txt")
+        stars = list(s)
+        random.shuffle(stars)
+        pairs = [(star1, star2) for star1 in stars[:4] for star2 in stars[:5]]
+        pairs.append(("Sol", "Sparta"))
+        pairs.append(("Sol", "Nowhere"))
+        results = dict(starmap.batch_routes(s, pairs + ["Kumasi"], 60,
+                                            max_workers=2))
+        self.assertEqual(set(star1 for star1, _ in pairs) | {"Kumasi"},
+                         set(results))
+        for star1, star2 in pairs:
+            self.assertEqual(starmap.traverse_starmap(s, star1, star2, 60),
+                             results[star1][star2])
+        self.assertEqual(["Kumasi", "Sparta"], results["Kumasi"]["Sparta"])
+        self.assertEqual(["Kumasi"], results["Kumasi"]["Kumasi"])
+        self.assertEqual([], results["Sol"]["Nowhere"])
+
+    def test_iter_starmap(self):
+        s = starmap.load_starmap("starmap.txt")
+        with open("starmap.txt", "rb") as file:
+            text = file.read()
+        with tempfile.TemporaryDirectory() as tmp:
+            for suffix, opener in ((".gz", gzip.open), (".bz2", bz2.open),
+                                   (".xz", lzma.open)):
+                path = os.path.join(tmp, "starmap" + suffix)
+                with opener(path, "wb") as file:
+                    file.write(text)
+                batches = list(starmap.iter_starmap(path, batch_size=10))
+                self.assertEqual(11, len(batches))
+                self.assertTrue(all(len(batch) <= 10 for batch in batches))
+                records = {name: (x, y, z) for batch in batches
+                           for name, x, y, z in batch}
+                self.assertEqual(s, records)
+                self.assertEqual(s, starmap.load_starmap(path))
+            path = os.path.join(tmp, "broken.txt")
+            with open(path, "w") as file:
+                file.write("1 2 3 Sol\n\n1 2 Vega\n")
+            with self.assertRaisesRegex(ValueError, "broken.txt:3"):
+                starmap.load_starmap(path)
+
+    def test_stream_jump_graph(self):
+        s = starmap.load_starmap("starmap.txt")
+        streamed = starmap.stream_jump_graph("starmap.txt", 60, batch_size=7)
+        built = starmap.build_jump_graph(s, 60)
+        self.assertEqual(len(built), len(streamed))
+        for node in built:
+            self.assertEqual(node.data, streamed[node.name].data)
+            self.assertEqual({dest.name: w for dest, w in node.all_edges()},
+                             {dest.name: w for dest, w in
+                              streamed[node.name].all_edges()})
+        self.assertEqual(["Sol", "Schrodinger", "Kumasi", "Sparta"],
+                         starmap.getPath("Sol", "Sparta", streamed))
+
+    def test_binary_starmap(self):
+        s = starmap.load_starmap("starmap.txt")
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "starmap.bin")
+            starmap.write_starmap_binary(path, s, 60)
+            catalog, graph, jumpdrive = starmap.read_starmap_binary(path)
+            self.assertEqual(60, jumpdrive)
+            self.assertEqual(s, dict(catalog))
+            expected = starmap.build_jump_csr(s, 60)
+            self.assertEqual(expected.edge_count(), graph.edge_count())
+            self.assertTrue(graph.connected("Sol", "Schrodinger"))
+            self.assertEqual(sorted(expected.all_back_edges(expected.id("Sol"))),
+                             sorted(graph.all_back_edges(graph.id("Sol"))))
+            state = IndexedTraversalState(len(graph))
+            for node in graph.dijkstra_traversal("Sol", state):
+                pass
+            self.assertEqual(["Sol", "Schrodinger", "Kumasi", "Sparta"],
+                             [graph.names[i] for i in state.path(graph.id("Sparta"))])
+            del catalog, graph, state
+            with open(path, "r+b") as file:
+                file.seek(8)
+                file.write(bytes([99]))
+            with self.assertRaisesRegex(ValueError, "version 99"):
+                starmap.read_starmap_binary(path)
+            with open(path, "r+b") as file:
+                file.write(b"NOTSTARS")
+            with self.assertRaisesRegex(ValueError, "not a binary starmap"):
+                starmap.read_starmap_binary(path)
+
+    def test_jumpdrive_sweep(self):
+        s = starmap.load_starmap("starmap.txt")
+        sweep = starmap.JumpdriveSweep(s, 495)
+        jumpdrives = list(range(0, 500, 15))
+        self.assertEqual(["Sol", "Schrodinger", "Kumasi", "Sparta"],
+                         sweep.route("Sol", "Sparta", 60))
+        stars = list(s)
+        random.shuffle(stars)
+        for star1, star2 in zip(stars[:4], stars[4:8]):
+            expected = [starmap.traverse_starmap(s, star1, star2, distance)
+                        for distance in jumpdrives]
+            self.assertEqual(expected, sweep.routes(star1, star2, jumpdrives))
+            needed = sweep.min_jumpdrive(star1, star2)
+            self.assertNotEqual([], starmap.traverse_starmap(s, star1, star2,
+                                                             needed))
+            self.assertEqual([], starmap.traverse_starmap(s, star1, star2,
+                                                          needed - 1e-9))
+        self.assertEqual(0, sweep.min_jumpdrive("Sol", "Sol"))
+        self.assertEqual(None, starmap.JumpdriveSweep(s, 1).min_jumpdrive(
+            "Sol", "Sparta"))
+        with self.assertRaises(ValueError):
+            sweep.route("Sol", "Sparta", 600)
+        self.assertEqual([], sweep.route("Sol", "Nowhere", 60))
+        with self.assertRaises(IndexError):
+            sweep.route("Nowhere", "Sol", 60)
+
+    def test_timings(self):
+        timings = starmap.PhaseTimings()
+        s = starmap.load_starmap("starmap.txt", timings)
+        self.assertEqual(["Sol", "Schrodinger", "Kumasi", "Sparta"],
+                         starmap.traverse_starmap(s, "Sol", "Sparta", 60, timings))
+        self.assertEqual({"load", "edge_build", "search", "reconstruct"},
+                         set(timings.phases))
+        self.assertTrue(all(t >= 0 for t in timings.phases.values()))
+
+    def test_unreachable(self):
+        s = starmap.load_starmap("starmap.txt")
+        navigator = starmap.StarNavigator(s, 20)
+        index = navigator.graph.connectivity()
+        pairs = [(star1, star2) for star1 in list(s)[:10]
+                 for star2 in list(s)[-10:]]
+        for star1, star2 in pairs:
+            if not index.may_reach(star1, star2):
+                self.assertEqual([], navigator.route(star1, star2))
+                self.assertEqual([], starmap.traverse_starmap(s, star1, star2, 20))
+                self.assertEqual([], starmap.getPath(star1, star2,
+                                                     navigator.graph))
+        # Those were answered without building any shortest path trees
+        self.assertEqual(0, len(navigator.trees))
+        self.assertTrue(any(not index.may_reach(*pair) for pair in pairs))
+        g = starmap.Graph.from_edges([(5, 0, 1)])
+        self.assertEqual([], starmap.getPath(0, 5, g))
+        self.assertEqual([5, 0], starmap.getPath(5, 0, g))
+        # getPath only uses an index that is already there and current
+        self.assertEqual({}, g.connectivity_indexes)
+        self.assertTrue(index.current())
+        rebuilds = index.rebuilds
+        node = next(node for node in navigator.graph if node.edges)
+        dest, weight = next(iter(node.edges.items()))
+        navigator.graph.disconnect(node.name, dest.name)
+        self.assertFalse(index.current())
+        starmap.getPath(node.name, dest.name, navigator.graph)
+        self.assertEqual(rebuilds, index.rebuilds)
+        navigator.graph.connect(node.name, dest.name, weight)
+        for star1, star2 in pairs:
+            if index.may_reach(star1, star2):
+                self.assertEqual(navigator.route(star1, star2),
+                                 starmap.traverse_starmap(s, star1, star2, 20))
+
+    def test_implicit(self):
+        s = starmap.load_starmap("starmap.txt")
+        stars = list(s)
+        random.shuffle(stars)
+        for jumpdrive in (20, 60, 300):
+            implicit = starmap.ImplicitJumpGraph(s, jumpdrive, cache_size=50)
+            for star1 in stars[:5]:
+                for star2 in stars[:15]:
+                    expected = starmap.traverse_starmap(s, star1, star2,
+                                                        jumpdrive)
+                    self.assertEqual(expected, implicit.route(star1, star2))
+                    self.assertEqual(expected, starmap.traverse_starmap(
+                        s, star1, star2, jumpdrive, implicit=True))
+            self.assertLessEqual(len(implicit.cache), 50)
+        implicit = starmap.ImplicitJumpGraph(s, 60)
+        self.assertEqual(["Sol", "Schrodinger", "Kumasi", "Sparta"],
+                         implicit.route("Sol", "Sparta"))
+        # Only the stars the search reached were expanded, and a second
+        # query along the same way reuses their neighbor lists
+        self.assertLess(implicit.expanded, len(s))
+        expanded = implicit.expanded
+        implicit.route("Sol", "Sparta")
+        self.assertEqual(expanded, implicit.expanded)
+        self.assertGreater(implicit.cache_hits, 0)
+        self.assertEqual(sorted(implicit.neighbors("Sol")),
+                         sorted((star2, distance) for star1, star2, distance
+                                in starmap.jump_edges(s, 60)
+                                if star1 == "Sol"))
+        self.assertEqual([], implicit.route("Sol", "Nowhere"))
+        with self.assertRaises(IndexError):
+            implicit.route("Nowhere", "Sol")
+        self.assertEqual(["Sol"], implicit.route("Sol", "Sol"))
+        self.assertEqual([], starmap.ImplicitJumpGraph(s, -1).route(
+            "Sol", "Sparta"))
+        timings = starmap.PhaseTimings()
+        starmap.traverse_starmap(s, "Sol", "Sparta", 60, timings,
+                                 implicit=True)
+        self.assertEqual({"grid_build", "search", "reconstruct"},
+                         set(timings.phases))
+        with self.assertRaises(ValueError):
+            starmap.ImplicitJumpGraph(s, 60, cache_size=-1)
+
 
 """Run the unit tests"""
 if __name__ == '__main__':